@@ -3,23 +3,148 @@
 
 # pylint: disable=c0111
 
+import os
 import re
+import sys
+import time
+import json
+import hashlib
+import cProfile
+from contextlib import contextmanager
 from pathlib import Path
 from itertools import chain
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
 # generate a validation notebook
 import nbformat
 
+# shared helpers, in ../tools
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tools"))
+from util import write_if_changed                   # pylint: disable=c0413
+
 DEBUG = False
 
 def debug(*args, **kwds):
     if DEBUG:
         print(*args, **kwds)
 
+class Profile:
+    """
+    collects wall time per phase, per-file parse time, bytes read and
+    written, and solution counts; dumped as JSON with --profile
+    """
+
+    def __init__(self):
+        # phase name -> seconds
+        self.phases = {}
+        # one dict per file scanned or parsed
+        self.files = []
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.files_written = 0
+        self.write_seconds = 0.
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (self.phases.get(name, 0.)
+                                 + time.perf_counter() - start)
+
+    def record_file(self, kind, path, seconds, found):
+        """
+        kind is either 'scan' or 'parse'; found is the number of
+        exomap entries, or of solutions, found in that file
+        """
+        size = path.stat().st_size
+        self.bytes_read += size
+        self.files.append(dict(kind=kind, path=str(path), bytes=size,
+                               seconds=round(seconds, 6), found=found))
+
+    def record_write(self, contents, seconds):
+        self.bytes_written += len(contents.encode())
+        self.files_written += 1
+        self.write_seconds += seconds
+
+    def dump(self, path):
+        save_json(Path(path), dict(
+            phases={name: round(seconds, 6)
+                    for name, seconds in self.phases.items()},
+            bytes_read=self.bytes_read,
+            bytes_written=self.bytes_written,
+            files_written=self.files_written,
+            write_seconds=round(self.write_seconds, 6),
+            files=self.files))
+
+    def print_summary(self, path, slowest=5):
+        phases = ", ".join(f"{name}={seconds:.3f}s"
+                           for name, seconds in self.phases.items())
+        print(f"profile: {phases} - read {self.bytes_read} bytes, "
+              f"wrote {self.bytes_written} bytes in {self.files_written} files"
+              f" - see {path}")
+        for record in sorted(self.files, key=lambda record: -record['seconds'])[:slowest]:
+            print(f"    {record['seconds']:.3f}s {record['kind']} {record['path']}")
+
+
+PROFILE = Profile()
+
+
+def parallel_map(function, iterable, jobs=1):
+    """
+    like map() but spread over that many processes when jobs > 1
+    results come back as a list, in the order of the input
+    """
+    if jobs <= 1:
+        return list(map(function, iterable))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(function, iterable))
+
+def timed(function, *args, **kwds):
+    """
+    returns a tuple (function(*args, **kwds), elapsed seconds)
+    can be used with parallel_map to time each task in its worker
+    """
+    start = time.perf_counter()
+    result = function(*args, **kwds)
+    return result, time.perf_counter() - start
+
 ########## helpers / filesystem
 
+def sha1(contents):
+    if isinstance(contents, str):
+        contents = contents.encode()
+    return hashlib.sha1(contents).hexdigest()
+
+
+# the caches and manifests are made obsolete by any change in this script
+SCRIPT_SHA1 = sha1(Path(__file__).read_bytes())
+
+
+def replace_file_with_string(path, contents):
+    """
+    write_if_changed, with the writes accounted for in PROFILE
+
+    returns True if the file was (over)written
+    """
+    start = time.perf_counter()
+    changed = write_if_changed(path, contents)
+    if changed:
+        PROFILE.record_write(contents, time.perf_counter() - start)
+    return changed
+
+
+def save_json(path, contents):
+    "atomically, so that a concurrent run never sees a partial file"
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp.open('w') as output:
+        json.dump(contents, output, indent=1)
+    tmp.replace(path)
+
 DEFAULT_COURSEDIR = "../../flotpython-course"
 
 def check_coursedir(coursedir):
@@ -31,16 +156,146 @@ def check_coursedir(coursedir):
 # where to find files like exo_carre.py, relative to COURSEDIR
 SOLUTION_PATHS = ["modules/corrections", "data"] + [f"w{i}" for i in range(1, 10)]
 
-def locate_stem(coursedir, name):
-    coursedir = Path(coursedir)
-    stem = Path(name).stem
-    for relpath in SOLUTION_PATHS:
-        for filename in [stem, f"{stem}.py", f"{stem}.md"]:
-            candidate = coursedir / relpath / filename
-            if candidate.exists():
-                return candidate
-    print(f"ERROR: could not spot stem {name} - aborting")
-    exit(1)
+class StemIndex:
+    """
+    An index of the files present in SOLUTION_PATHS, built once per run,
+    so that locating a stem does not need to probe the filesystem
+
+    each directory is listed once; with an ExomapCache, a directory whose
+    mtime has not changed is not even listed
+    """
+    def __init__(self, coursedir, cache=None):
+        self.coursedir = Path(coursedir)
+        # relpath -> set of names in that directory
+        self.names = {relpath: set(self.list_directory(relpath, cache))
+                      for relpath in SOLUTION_PATHS}
+
+    def list_directory(self, relpath, cache):
+        directory = self.coursedir / relpath
+        try:
+            mtime_ns = directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            return []
+        names = cache.get_directory(relpath, mtime_ns) if cache else None
+        if names is None:
+            names = sorted(entry.name for entry in os.scandir(directory))
+            if cache:
+                cache.put_directory(relpath, mtime_ns, names)
+        return names
+
+    def candidates(self, name):
+        """
+        all the places where that stem can be found, in order of preference
+        """
+        stem = Path(name).stem
+        for relpath in SOLUTION_PATHS:
+            for filename in [stem, f"{stem}.py", f"{stem}.md"]:
+                if filename in self.names[relpath]:
+                    yield self.coursedir / relpath / filename
+
+    def locate(self, name):
+        candidates = list(self.candidates(name))
+        if not candidates:
+            print(f"ERROR: could not spot stem {name} - aborting")
+            exit(1)
+        if len({candidate.parent for candidate in candidates}) > 1:
+            print(f"WARNING: stem {name} is ambiguous, using {candidates[0]}")
+            for candidate in candidates[1:]:
+                print(f"    ignoring {candidate}")
+        return candidates[0]
+
+
+class ExomapCache:
+    """
+    An on-disk cache for Exomap.scan_filesystem
+
+    for each notebook we store its fingerprint (mtime, size, sha1)
+    together with the (exo, week, seq, source) entries it yields,
+    so that only modified notebooks need to be re-scanned
+
+    it also stores the directory listings used by StemIndex
+
+    a cache made by another version of this script is discarded
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, coursedir):
+        self.path = Path(path)
+        self.coursedir = coursedir
+        self.notebooks = {}
+        self.directories = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        try:
+            with self.path.open() as feed:
+                contents = json.load(feed)
+            # discard a cache made with another format, another version
+            # of this script, or for another course
+            if (contents['version'] == self.VERSION
+                    and contents.get('script') == SCRIPT_SHA1
+                    and contents['coursedir'] == str(self.coursedir.resolve())):
+                self.notebooks = contents['notebooks']
+                self.directories = contents.get('directories', {})
+        except FileNotFoundError:
+            pass
+        except Exception as exc:                        # pylint: disable=w0703
+            print(f"WARNING: ignoring unreadable cache {self.path} - {exc}")
+        return self
+
+    def save(self):
+        contents = dict(version=self.VERSION,
+                        script=SCRIPT_SHA1,
+                        coursedir=str(self.coursedir.resolve()),
+                        notebooks=self.notebooks,
+                        directories=self.directories)
+        save_json(self.path, contents)
+
+    def get(self, notebook):
+        """
+        returns the cached entries for that notebook, or None
+        a notebook whose mtime has changed but not its contents
+        (typically after a git checkout) is still a hit
+        """
+        key = str(notebook.relative_to(self.coursedir))
+        stat = notebook.stat()
+        record = self.notebooks.get(key)
+        if record is None or record['size'] != stat.st_size:
+            self.misses += 1
+            return None
+        if record['mtime_ns'] != stat.st_mtime_ns:
+            if record['sha1'] != sha1(notebook.read_bytes()):
+                self.misses += 1
+                return None
+            record['mtime_ns'] = stat.st_mtime_ns
+        self.hits += 1
+        return record['entries']
+
+    def put(self, notebook, entries):
+        key = str(notebook.relative_to(self.coursedir))
+        stat = notebook.stat()
+        self.notebooks[key] = dict(
+            mtime_ns=stat.st_mtime_ns, size=stat.st_size,
+            sha1=sha1(notebook.read_bytes()), entries=entries)
+
+    def get_directory(self, relpath, mtime_ns):
+        record = self.directories.get(relpath)
+        if record is None or record['mtime_ns'] != mtime_ns:
+            return None
+        return record['names']
+
+    def put_directory(self, relpath, mtime_ns, names):
+        self.directories[relpath] = dict(mtime_ns=mtime_ns, names=names)
+
+    def prune(self, notebooks):
+        "forget about notebooks that have gone"
+        keys = {str(notebook.relative_to(self.coursedir))
+                for notebook in notebooks}
+        for key in list(self.notebooks):
+            if key not in keys:
+                del self.notebooks[key]
 
 
 class Exomap(dict):
@@ -59,37 +314,73 @@ class Exomap(dict):
     filename_pat = re.compile(r'w(?P<week>[0-9]+)-s(?P<seq>[0-9]+).*')
     import_line_pat = re.compile(r'from\s+corrections\.(?P<source>(regexp|gen|exo|cls)_\w+)\s+import\s+exo_(?P<exo>\w+)')
 
-    def scan_filesystem(self):
-        notebooks = chain(self.coursedir.glob("w?/w*-x*.ipynb"),
-                          self.coursedir.glob("w?/w*-x*.py"),
-                          self.coursedir.glob("w?/w*-x*.md"))
-        for notebook in sorted(notebooks):
-            debug(f"exomap scanning {notebook}")
-            match1 = self.filename_pat.match(notebook.stem)
-            if not match1:
-                print(f"something wrong with {notebook.stem}")
-                exit(1)
-            week, seq = match1.groups()
-            # search indirection
-            # usual use case is a notebook imports an exercise
-            with notebook.open() as feed:
-                for line in feed:
-                    line = line.strip()
-                    match2 = self.import_line_pat.search(line)
-                    if match2:
-                        source = match2.group('source')
-                        exo = match2.group('exo')
-                        self[exo] = week, seq, source
-                    elif 'import' in line and 'from' in line:
-                        debug(f"Warning: ignoring potential exo import ```{line}'''")
-            # search in notebook directly
-            # use case is like exercise Taylor, a notebook has a hidden
-            # cell with code embedded right into it
-            try:
-                source = Source(notebook, self)
-                source.parse(week=week, seq=seq)
-            except Exception as exc:
-                print(f"WHOOPS cannot parse - {type(exc)} {exc}")
+    def scan_filesystem(self, cache=None, jobs=1):
+        """
+        cache, if provided, is an ExomapCache instance; notebooks
+        that are unchanged since the previous run are not read at all
+
+        with jobs > 1, the notebooks to be read are scanned in
+        that many processes; the outcome is the same
+        """
+        notebooks = sorted(chain(self.coursedir.glob("w?/w*-x*.ipynb"),
+                                 self.coursedir.glob("w?/w*-x*.py"),
+                                 self.coursedir.glob("w?/w*-x*.md")))
+        cached = {notebook: cache.get(notebook) if cache else None
+                  for notebook in notebooks}
+        missing = [notebook for notebook, entries in cached.items()
+                   if entries is None]
+        scanned = parallel_map(partial(timed, self.scan_notebook),
+                               missing, jobs)
+        for notebook, (entries, seconds) in zip(missing, scanned):
+            PROFILE.record_file('scan', notebook, seconds, len(entries))
+            cached[notebook] = entries
+            if cache:
+                cache.put(notebook, entries)
+        for notebook in notebooks:
+            entries = cached[notebook]
+            # entries come in the order they were spotted in the notebook
+            # so replaying them yields the same outcome as a full scan
+            for exo, week, seq, source in entries:
+                self[exo] = week, seq, source
+        if cache:
+            cache.prune(notebooks)
+            debug(f"exomap cache: {cache.hits} hits, {cache.misses} misses")
+
+    def scan_notebook(self, notebook):
+        """
+        returns a list of (exo, week, seq, source) tuples
+        in the order where they are found in that notebook
+        """
+        debug(f"exomap scanning {notebook}")
+        match1 = self.filename_pat.match(notebook.stem)
+        if not match1:
+            print(f"something wrong with {notebook.stem}")
+            exit(1)
+        week, seq = match1.groups()
+        # collect what this notebook has to say in a separate map
+        found = Exomap(self.coursedir)
+        # search indirection
+        # usual use case is a notebook imports an exercise
+        with notebook.open() as feed:
+            for line in feed:
+                line = line.strip()
+                match2 = self.import_line_pat.search(line)
+                if match2:
+                    source = match2.group('source')
+                    exo = match2.group('exo')
+                    found[exo] = week, seq, source
+                elif 'import' in line and 'from' in line:
+                    debug(f"Warning: ignoring potential exo import ```{line}'''")
+        # search in notebook directly
+        # use case is like exercise Taylor, a notebook has a hidden
+        # cell with code embedded right into it
+        try:
+            source = Source(notebook, found)
+            source.parse(week=week, seq=seq)
+        except Exception as exc:
+            print(f"WHOOPS cannot parse - {type(exc)} {exc}")
+        return [(exo, week, seq, source)
+                for exo, (week, seq, source) in found.items()]
 
 
     def all_stems(self, *weeks):
@@ -142,7 +433,9 @@ class Solution:                                         # pylint: disable=r0902
         # if set (to anything), no example show up in the validation nb
         self.no_example = no_example
         # internals : the Source parser will feed the code in there
-        self.code = ""
+        # as a list of lines, that get joined only once
+        self.code_lines = []
+        self._code = None
         # the first solution for an exercise also keeps track
         # of its sibling solutions
         self.siblings = []
@@ -151,6 +444,14 @@ class Solution:                                         # pylint: disable=r0902
         return f"<Solution from {self.filename} function={self.name} " \
                f"week={self.week} seq={self.sequence} more={self.more}>"
 
+    def signature(self):
+        """
+        everything that has an impact on the outputs for that solution
+        """
+        return (self.filename, self.week, self.sequence, self.name,
+                self.more, self.continued, self.latex_size,
+                self.no_validation, self.no_example, self.code)
+
     @property
     def qual_name(self):
         if not self.more:
@@ -159,7 +460,14 @@ class Solution:                                         # pylint: disable=r0902
 
     def add_code_line(self, line):
         "convenience for the parser code"
-        self.code += line + "\n"
+        self.code_lines.append(line)
+        self._code = None
+
+    @property
+    def code(self):
+        if self._code is None:
+            self._code = "".join(f"{line}\n" for line in self.code_lines)
+        return self._code
 # corriges.py would have the ability to do sorting, but..
 # I turn it off because it is less accurate
 # solutions appear in the right week/sequence order, but
@@ -204,6 +512,11 @@ label=%(name)s%(more)s%(continued)s - {\small \footnotesize{Semaine} %(week)s \f
         return toc + body
 
     # the validation notebook
+    # the first line of the cells that run a correction
+    # tells what outcome is expected, see run_validation_unit()
+    expect_ok = "# should be OK"
+    expect_ko = "# dummy solution - should be KO"
+
     def add_validation(self, notebook, *, first, broken):
         """
         Parameters:
@@ -236,7 +549,7 @@ label=%(name)s%(more)s%(continued)s - {\small \footnotesize{Semaine} %(week)s \f
 
         if broken:
             cell = Cell()
-            cell.add_line(f"# dummy solution - should be KO")
+            cell.add_line(self.expect_ko)
             broken = f"{solution}_ko"
             cell.add_line(
 f"""if not hasattr({module}, '{broken}'):
@@ -263,7 +576,7 @@ else:
                 cell.add_line(f"{exo}.example()")
             cell.record()
         cell = Cell()
-        cell.add_line("# should be OK")
+        cell.add_line(self.expect_ok)
         cell.add_line(f"from {module} import {full_solution}")
         cell.add_line(f"{exo}.correction({full_solution})")
         cell.record()
@@ -311,92 +624,223 @@ class Source:                                           # pylint: disable=r0903
     def __repr__(self):
         return f"<Source {self.path}>"
 
-    beg_matcher = re.compile(
-        r"\A. @BEG@(?P<keywords>(\s+[a-z_]+=[a-z_A-Z0-9-]+)+)\s*\Z"
-    )
-    end_matcher = re.compile(
-        r"\A. @END@"
+    # a single pass tokenizer: one regex that spots both markers
+    # it is only tried on lines that contain a @ in the first place
+    marker_matcher = re.compile(
+        r"\A. @(?:(?P<end>END@)"
+        r"|BEG@(?P<keywords>(\s+[a-z_]+=[a-z_A-Z0-9-]+)+)\s*\Z)"
     )
     filename_matcher = re.compile(
         r"\Aw(?P<week>[0-9]+)s(?P<sequence>[0-9]+)_"
     )
 
-    def parse(self, week=None, seq=None):                  # pylint: disable=r0912, r0914
+    def parse(self, week=None, seq=None, events=None):
         """
+        events, if provided, is the result of a previous tokenize()
+        typically done in a worker process
+
         return a tuple of
         * list of all Solution objects
         * list of unique (first) Solution per function
         that is to say, if one function has several solutions,
         only the first instance appears in tuple[1]
         """
-        solution = None
         self.solutions = []
         self.functions = []
         # a map name -> main solution
         map_by_name = {}
+        for solution in self.iter_solutions(week=week, seq=seq, events=events):
+            # self.functions keeps only the main / first
+            # solution for one problem
+            if solution.name not in map_by_name:
+                # record main / first solution
+                map_by_name[solution.name] = solution
+                self.functions.append(solution)
+            else:
+                map_by_name[solution.name].siblings.append(solution)
+            # self.solutions memorize all solutions
+            self.solutions.append(solution)
+        return (self.solutions, self.functions)
+
+    def tokenize(self):
+        """
+        a generator that reads the file in one pass, and yields events
+        * ('beg', lineno, line, keywords_string) for a @BEG@ line
+        * ('end', lineno, line) for a @END@ line
+        * ('code', line) for the lines in between
+
+        this part does not depend on exomap, so it can run in a worker;
+        code lines are dropped only when they are for sure outside of
+        any solution, i.e. before the first @BEG@ or after a @END@
+        """
+        maybe_open = False
         with self.path.open() as feed:
             for lineno, line in enumerate(feed, 1):
                 # remove EOL for convenience
                 if line[-1] == "\n":
                     line = line[:-1]
-                begin = self.beg_matcher.match(line)
-                end = self.end_matcher.match(line)
-                if begin:
-                    assignments = begin.group('keywords').split()
-                    keywords = {}
-                    for assignment in assignments:
-                        key, value = assignment.split('=')
-                        keywords[key] = value
-                    if 'name' not in keywords:
-                        print(f"{self.path}:{lineno} 'name' missing keyword")
-                        continue
-                    name = keywords['name']
-                    # direct insertion of code in a tagged notebook
-                    if week and seq:
-                        debug(f"{self.path}:{lineno} parsing notebook "
-                              f"from week={week} seq={seq}")
-                        self.exomap[name] = (week, seq, self.path.stem)
-                        # for building the solution
-                        keywords.update(dict(week=week, sequence=seq))
-                    elif 'week' in keywords and 'sequence' in keywords:
-                        print(f"{self.path}:{lineno} using explicit week and sequence")
-                        self.exomap[name] = (keywords['week'],
-                                             keywords['sequence'],
-                                             self.path.stem)
-                    else:
-                        week, sequence, _ = self.exomap.get(name, (None, None, None))
-                        if not week or not sequence:
-                            print(f"{self.path}:{lineno} cannot spot week or sequence")
-                            continue
-                        keywords['week'] = week
-                        keywords['sequence'] = sequence
-                    try:
-                        solution = Solution(path=self.path, **keywords)
-                    except Exception:                   # pylint: disable=w0703
-                        import traceback
-                        traceback.print_exc()
-                        print(f"{self.path}:{lineno}: ERROR (ignored): {line}")
-                elif end:
-                    if solution is None:
-                        print(f"{self.path}:{lineno} - Unexpected @END@ - ignored\n{line}")
-                    else:
-                        # self.functions keeps only the main / first 
-                        # solution for one problem
-                        if solution.name not in map_by_name:
-                            # record main / first solution
-                            map_by_name[solution.name] = solution
-                            self.functions.append(solution)
-                        else:
-                            map_by_name[solution.name].siblings.append(solution)
-                        # self.solutions memorize all solutions
-                        self.solutions.append(solution)
-                        solution = None
+                if '@' not in line:
+                    if maybe_open:
+                        yield ('code', line)
+                    continue
+                match = self.marker_matcher.match(line)
+                if match and match.group('keywords'):
+                    maybe_open = True
+                    yield ('beg', lineno, line, match.group('keywords'))
+                elif match:
+                    maybe_open = False
+                    yield ('end', lineno, line)
                 elif '@BEG@' in line or '@END@' in line:
                     print(f"{self.path}:{lineno} Warning - misplaced @BEG|END@ - ignored\n{line}")
-                    continue
-                elif solution:
-                    solution.add_code_line(line)
-        return (self.solutions, self.functions)
+                elif maybe_open:
+                    yield ('code', line)
+
+    def iter_solutions(self, week=None, seq=None, events=None):
+        """
+        a generator that yields Solution objects as soon as
+        their @END@ marker shows up; week and sequence are resolved
+        against exomap here, so this must run in input order
+
+        only the solution being read is kept in memory
+        """
+        if events is None:
+            events = self.tokenize()
+        solution = None
+        for event in events:
+            if event[0] == 'code':
+                if solution:
+                    solution.add_code_line(event[1])
+            elif event[0] == 'beg':
+                _, lineno, line, keywords_string = event
+                # on errors we keep on with the current solution, if any
+                solution = self.begin_solution(
+                    lineno, line, keywords_string, week, seq) or solution
+            else:
+                _, lineno, line = event
+                if solution is None:
+                    print(f"{self.path}:{lineno} - Unexpected @END@ - ignored\n{line}")
+                else:
+                    yield solution
+                    solution = None
+
+    def begin_solution(self, lineno, line, keywords_string, week, seq):
+        """
+        create a Solution from the keywords on a @BEG@ line
+
+        returns None if that line cannot be used
+        """
+        keywords = {}
+        for assignment in keywords_string.split():
+            key, value = assignment.split('=')
+            keywords[key] = value
+        if 'name' not in keywords:
+            print(f"{self.path}:{lineno} 'name' missing keyword")
+            return None
+        name = keywords['name']
+        # direct insertion of code in a tagged notebook
+        if week and seq:
+            debug(f"{self.path}:{lineno} parsing notebook "
+                  f"from week={week} seq={seq}")
+            self.exomap[name] = (week, seq, self.path.stem)
+            # for building the solution
+            keywords.update(dict(week=week, sequence=seq))
+        elif 'week' in keywords and 'sequence' in keywords:
+            print(f"{self.path}:{lineno} using explicit week and sequence")
+            self.exomap[name] = (keywords['week'],
+                                 keywords['sequence'],
+                                 self.path.stem)
+        else:
+            week, sequence, _ = self.exomap.get(name, (None, None, None))
+            if not week or not sequence:
+                print(f"{self.path}:{lineno} cannot spot week or sequence")
+                return None
+            keywords['week'] = week
+            keywords['sequence'] = sequence
+        try:
+            return Solution(path=self.path, **keywords)
+        except Exception:                               # pylint: disable=w0703
+            import traceback
+            traceback.print_exc()
+            print(f"{self.path}:{lineno}: ERROR (ignored): {line}")
+            return None
+
+
+def tokenize_source(path):
+    """
+    the part of parsing a source file that can run in a worker process
+
+    returns the list of events, see Source.tokenize()
+    """
+    return list(Source(path, None).tokenize())
+
+############################################################
+
+
+class BuildManifest:
+    """
+    keeps track, for each output file, of the sources and Solution
+    objects that it was made from, so that an output is regenerated
+    only when its inputs have changed
+
+    the digest of an output also covers this very script, as well as
+    any extra parameter (title, etc..) that the output depends upon
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.outputs = {}
+
+    def load(self):
+        try:
+            with self.path.open() as feed:
+                contents = json.load(feed)
+            if contents['version'] == self.VERSION:
+                self.outputs = contents['outputs']
+        except FileNotFoundError:
+            pass
+        except Exception as exc:                        # pylint: disable=w0703
+            print(f"WARNING: ignoring unreadable manifest {self.path} - {exc}")
+        return self
+
+    def save(self):
+        save_json(self.path, dict(version=self.VERSION, outputs=self.outputs))
+
+    @staticmethod
+    def digest(solutions, extras):
+        hasher = hashlib.sha1(SCRIPT_SHA1.encode())
+        hasher.update(repr(extras).encode())
+        for solution in solutions:
+            hasher.update(repr(solution.signature()).encode())
+        return hasher.hexdigest()
+
+    def update(self, path, solutions, write, *extras):
+        """
+        call write() to regenerate path, unless the solutions and extras
+        are the same as the last time path was written
+
+        write() is expected to return True if the file has changed
+        """
+        key = str(path)
+        digest = self.digest(solutions, extras)
+        record = self.outputs.get(key)
+        if (record and record['digest'] == digest
+                and path.exists() and sha1(path.read_bytes()) == record['sha1']):
+            print(f"{path} up to date")
+            return False
+        changed = write()
+        self.outputs[key] = dict(
+            digest=digest,
+            sha1=sha1(path.read_bytes()),
+            sources=sorted({str(solution.path) for solution in solutions}),
+            solutions=[repr(solution) for solution in solutions],
+        )
+        return changed
+
+    @staticmethod
+    def report(path, changed):
+        print(f"{path} (over)written" if changed else f"{path} unchanged")
 
 ############################################################
 
@@ -417,7 +861,7 @@ class Latex:
 \setlength{\textheight}{22cm}
 \setlength{\headsep}{1.5cm}
 \setlength{\parindent}{0.5cm}
-\begin{document}
+%(preamble)s\begin{document}
 \begin{center}
 {\huge %(title)s}
 \end{center}
@@ -443,20 +887,69 @@ class Latex:
     def __init__(self, path):
         self.path = path
 
-    def write(self, solutions, title_list, contents):
+    def render(self, solutions, title_list, contents):
         week = None
-        with self.path.open('w') as output:
-            title_tex = " \\\\ \\mbox{} \\\\ ".join(title_list)
-            output.write(Latex.header % (dict(title=title_tex)))
-            if contents:
-                output.write(Latex.contents)
-            for solution in solutions:
-                if solution.week != week:
-                    week = solution.week
-                    output.write(self.week_format.format(week))
-                output.write(solution.latex())
-            output.write(Latex.footer)
-        print(f"{self.path} (over)written")
+        title_tex = " \\\\ \\mbox{} \\\\ ".join(title_list)
+        chunks = [Latex.header % (dict(title=title_tex, preamble=""))]
+        if contents:
+            chunks.append(Latex.contents)
+        for solution in solutions:
+            if solution.week != week:
+                week = solution.week
+                chunks.append(self.week_format.format(week))
+            chunks.append(solution.latex())
+        chunks.append(Latex.footer)
+        return "".join(chunks)
+
+    def write(self, solutions, title_list, contents):
+        changed = replace_file_with_string(
+            self.path, self.render(solutions, title_list, contents))
+        BuildManifest.report(self.path, changed)
+        return changed
+
+    # sharded mode: one fragment per week, and a master file that
+    # \include's them all; with \includeonly, latex can then
+    # be asked to recompile only some weeks
+    # note that \include starts each week on a new page
+
+    @staticmethod
+    def by_week(solutions):
+        """
+        returns a list of (week, solutions) in order of appearance
+        """
+        weeks = {}
+        for solution in solutions:
+            weeks.setdefault(solution.week, []).append(solution)
+        return list(weeks.items())
+
+    def fragment_path(self, week):
+        return self.path.with_name(f"{self.path.stem}-week{week}.tex")
+
+    def write_fragment(self, week, solutions):
+        path = self.fragment_path(week)
+        changed = replace_file_with_string(
+            path,
+            self.week_format.format(week)
+            + "".join(solution.latex() for solution in solutions))
+        BuildManifest.report(path, changed)
+        return changed
+
+    def write_master(self, weeks, title_list, contents, include_only=None):
+        title_tex = " \\\\ \\mbox{} \\\\ ".join(title_list)
+        preamble = ""
+        if include_only:
+            only = ",".join(self.fragment_path(week).stem
+                            for week in include_only)
+            preamble = f"\\includeonly{{{only}}}\n"
+        chunks = [Latex.header % (dict(title=title_tex, preamble=preamble))]
+        if contents:
+            chunks.append(Latex.contents)
+        for week in weeks:
+            chunks.append(f"\\include{{{self.fragment_path(week).stem}}}\n")
+        chunks.append(Latex.footer)
+        changed = replace_file_with_string(self.path, "".join(chunks))
+        BuildManifest.report(self.path, changed)
+        return changed
 
     @staticmethod
     def escape(string):
@@ -478,13 +971,16 @@ class Text:                                             # pylint: disable=r0903
 ############################################################
 """
 
+    def render(self, solutions, title_list):
+        return "".join(
+            [self.header_format.format(title=title) for title in title_list]
+            + [solution.text() for solution in solutions])
+
     def write(self, solutions, title_list):
-        with self.path.open('w') as output:
-            for title in title_list:
-                output.write(self.header_format.format(title=title))
-            for solution in solutions:
-                output.write(solution.text())
-        print(f"{self.path} (over)written")
+        changed = replace_file_with_string(
+            self.path, self.render(solutions, title_list))
+        BuildManifest.report(self.path, changed)
+        return changed
 
 ####################
 
@@ -505,19 +1001,24 @@ class Notebook:
             return "\n".join(contents)
         return ""
 
+    # cell ids are random by default, we need them to be stable
+    # so that an unchanged notebook does not get rewritten
+    def _next_id(self):
+        return f"cell-{len(self.notebook['cells'])}"
+
     def add_text_cell(self, contents):
         self.notebook['cells'].append(
             nbformat.v4.new_markdown_cell(
-                self._normalize(contents)
+                self._normalize(contents), id=self._next_id()
             ))
 
     def add_code_cell(self, contents):
         self.notebook['cells'].append(
             nbformat.v4.new_code_cell(
-                self._normalize(contents)
+                self._normalize(contents), id=self._next_id()
             ))
 
-    def write(self, solutions):
+    def render(self, solutions):
 
         # find out which are the first ones
         # and which are alternate solutions
@@ -542,10 +1043,122 @@ class Notebook:
         if previous:
             previous.add_validation(self, first=None, broken=True)
 
-        # JSON won't like an extra comma
-        with self.path.open('w') as output:
-            nbformat.write(self.notebook, output)
-        print(f"{self.path} (over)written")
+        return nbformat.writes(self.notebook)
+
+    def write(self, solutions):
+        changed = replace_file_with_string(self.path, self.render(solutions))
+        BuildManifest.report(self.path, changed)
+        return changed
+
+##########
+
+
+def run_validation_unit(path, exec_dir, timeout):
+    """
+    execute one validation notebook in its own kernel,
+    typically in a worker process
+
+    nbautoeval does not raise when a solution is wrong, it just displays
+    its verdict; but it also logs one OK or KO line per correction in the
+    file pointed at by NBAUTOEVAL_LOG, that we read after each cell and
+    compare with the outcome that the cell expects
+
+    returns a dict suitable for the validation report
+    """
+    # only needed in this mode, so imported lazily
+    import tempfile
+    from nbclient import NotebookClient
+    from nbclient.exceptions import CellExecutionError
+
+    notebook = nbformat.read(str(path), as_version=4)
+    mismatches = []
+    with tempfile.TemporaryDirectory() as logdir:
+        log = Path(logdir) / "nbautoeval.log"
+        log.touch()
+        with log.open() as feed:
+            def check_outcomes(cell, cell_index, **_):
+                expected = {Solution.expect_ok: "OK",
+                            Solution.expect_ko: "KO"}.get(cell.source.split("\n")[0])
+                for line in feed.readlines():
+                    # <date> <user> <exoname> OK|KO
+                    *_, exoname, outcome = line.split()
+                    if expected and outcome != expected:
+                        mismatches.append(
+                            f"cell {cell_index}: {exoname} is {outcome},"
+                            f" {expected} was expected")
+            client = NotebookClient(
+                notebook, timeout=timeout, kernel_name='python3',
+                resources={'metadata': {'path': str(exec_dir)}},
+                on_cell_executed=check_outcomes)
+            status, error = 'pass', None
+            start = time.perf_counter()
+            try:
+                client.execute(env=dict(os.environ, NBAUTOEVAL_LOG=str(log)))
+            except CellExecutionError as exc:
+                status, error = 'fail', f"{exc.ename}: {exc.evalue}"
+            except Exception as exc:                    # pylint: disable=w0703
+                status, error = 'error', f"{type(exc).__name__}: {exc}"
+    if status == 'pass' and mismatches:
+        status, error = 'fail', "; ".join(mismatches)
+    return dict(unit=path.stem, status=status,
+                seconds=round(time.perf_counter() - start, 3),
+                error=error)
+
+
+class Validation:
+    """
+    instead of one big validation notebook that runs all exercises
+    in a single kernel, write one notebook per exercise in a directory,
+    and run them over a pool of processes - one kernel each
+
+    a unit fails if one of its cells raises an exception, or if
+    a correction has not the expected outcome - OK, or KO for _ko solutions
+    """
+
+    def __init__(self, directory, report):
+        self.directory = Path(directory)
+        self.report = Path(report)
+
+    @staticmethod
+    def by_exercise(solutions):
+        """
+        returns a list of (name, solutions) in order of appearance
+        """
+        exercises = {}
+        for solution in solutions:
+            # continuation chunks are not new solutions
+            if solution.continued:
+                continue
+            exercises.setdefault(solution.name, []).append(solution)
+        return list(exercises.items())
+
+    def write_units(self, solutions):
+        self.directory.is_dir() or self.directory.mkdir()
+        units = []
+        for name, group in self.by_exercise(solutions):
+            path = self.directory / f"{name}.ipynb"
+            Notebook(path).write(group)
+            units.append(path)
+        return units
+
+    def run(self, solutions, exec_dir, jobs=1, timeout=120):
+        units = self.write_units(solutions)
+        start = time.perf_counter()
+        results = parallel_map(
+            partial(run_validation_unit, exec_dir=exec_dir, timeout=timeout),
+            units, jobs)
+        wall = time.perf_counter() - start
+        failed = [result for result in results if result['status'] != 'pass']
+        save_json(self.report, dict(
+            units=results, jobs=jobs,
+            wall_seconds=round(wall, 3),
+            cpu_seconds=round(sum(result['seconds'] for result in results), 3),
+            passed=len(results) - len(failed), failed=len(failed)))
+        for result in failed:
+            print(f"{result['status'].upper()} {result['unit']} - {result['error']}")
+        print(f"{len(results)} validation units, {len(failed)} failed, "
+              f"in {wall:.1f}s - see {self.report}")
+        return not failed
 
 ##########
 
@@ -584,13 +1197,47 @@ def main():                                      # pylint: disable=r0914, r0915
     parser.add_argument("-N", "--notebook", action='store_true', default=False)
     parser.add_argument("-T", "--text", action='store_true', default=False)
     parser.add_argument("-S", "--separate", action='store_true', default=False)
+    parser.add_argument("-V", "--validate", action='store_true', default=False,
+                        help="write one validation notebook per exercise"
+                             " and run them all, using --jobs kernels")
+    parser.add_argument("--timeout", type=int, default=120,
+                        help="timeout for each cell in validation notebooks")
+    parser.add_argument("--cache", default="exomap.cache",
+                        help="where to store the exomap cache")
+    parser.add_argument("--no-cache", action='store_true', default=False,
+                        help="rescan all notebooks and do not use the cache")
+    parser.add_argument("--shard", action='store_true', default=False,
+                        help="with latex output, write one .tex file per week"
+                             " and a master file that includes them")
+    parser.add_argument("--include-only", default=None,
+                        help="with --shard, a comma-separated list of weeks"
+                             " to be compiled by latex, e.g. 2,3")
+    parser.add_argument("-f", "--force", action='store_true', default=False,
+                        help="ignore the build manifest and regenerate all outputs")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of processes for scanning, parsing"
+                             " and validating")
+    parser.add_argument("-P", "--profile", action='store_true', default=False,
+                        help="store timings and counters in <output>.profile.json")
+    parser.add_argument("--pstats", default=None,
+                        help="also run under cProfile and store stats in that file")
     parser.add_argument("weeks_or_files", nargs='+')
     args = parser.parse_args()
 
+    profiler = None
+    if args.pstats:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
     coursedir = Path(args.coursedir)
     check_coursedir(coursedir)
     exomap = Exomap(coursedir)
-    exomap.scan_filesystem()
+    with PROFILE.phase('scan'):
+        cache = None if args.no_cache else ExomapCache(args.cache, coursedir).load()
+        exomap.scan_filesystem(cache, args.jobs)
+        stem_index = StemIndex(coursedir, cache)
+        if cache:
+            cache.save()
     debug(f"exomap has {len(exomap)} keys")
     # always store the exo map so we can detect any mishaps
     with Path("exomap.check").open('w') as output:
@@ -604,19 +1251,24 @@ def main():                                      # pylint: disable=r0914, r0915
     for arg in args.weeks_or_files:
         if re.match("[0-9]+", arg):
             for stem in exomap.all_stems(arg):
-                path = locate_stem(coursedir, stem)
+                path = stem_index.locate(stem)
                 input_paths.append(path)
                 debug(input_paths)
         else:
             input_paths.append(Path(arg))
 
-    sources = []
-    for path in input_paths:
-        source = Source(path, exomap)
-        sources.append(source)
-        sols, funs = source.parse()
-        solutions += sols
-        functions += funs
+    # with several jobs, the sources are read and tokenized in workers;
+    # week and sequence are then resolved sequentially, in input order,
+    # since a source can rely on the explicit week= and sequence= tags
+    # of another one; this way the outcome does not depend on --jobs
+    with PROFILE.phase('parse'):
+        tokenized = parallel_map(partial(timed, tokenize_source),
+                                 input_paths, args.jobs)
+        for path, (events, seconds) in zip(input_paths, tokenized):
+            sols, funs = Source(path, exomap).parse(events=events)
+            PROFILE.record_file('parse', path, seconds, len(sols))
+            solutions += sols
+            functions += funs
 
     if args.latex:
         do_latex = True
@@ -638,6 +1290,11 @@ def main():                                      # pylint: disable=r0914, r0915
         do_text = False
         do_notebook = False
         do_separate = True
+    elif args.validate:
+        do_latex = False
+        do_text = False
+        do_notebook = False
+        do_separate = False
     else:
         do_latex = True
         do_text = True
@@ -649,25 +1306,78 @@ def main():                                      # pylint: disable=r0914, r0915
     txtoutput = Path(f"{output}.txt")
     nboutput = Path(f"{output}.ipynb")
     title_list = args.title.split(";")
-    if do_latex:
-        Latex(texoutput).write(
-            solutions, title_list=title_list, contents=args.contents)
+    # outputs are regenerated only if their inputs have changed
+    # and rewritten only if their contents actually differ
+    manifest = BuildManifest(f"{output}.manifest")
+    if not args.force:
+        manifest.load()
+    if do_latex and args.shard:
+        with PROFILE.phase('latex'):
+            latex = Latex(texoutput)
+            weeks = []
+            for week, week_solutions in Latex.by_week(solutions):
+                weeks.append(week)
+                manifest.update(
+                    latex.fragment_path(week), week_solutions,
+                    lambda week=week, week_solutions=week_solutions:
+                        latex.write_fragment(week, week_solutions),
+                    'latex-fragment', week)
+            include_only = (args.include_only.split(",")
+                            if args.include_only else None)
+            manifest.update(
+                texoutput, [],
+                lambda: latex.write_master(
+                    weeks, title_list, args.contents, include_only),
+                'latex-master', title_list, args.contents, weeks, include_only)
+    elif do_latex:
+        with PROFILE.phase('latex'):
+            manifest.update(
+                texoutput, solutions,
+                lambda: Latex(texoutput).write(
+                    solutions, title_list=title_list, contents=args.contents),
+                'latex', title_list, args.contents)
     if do_text:
-        Text(txtoutput).write(solutions, title_list=title_list)
+        with PROFILE.phase('text'):
+            manifest.update(
+                txtoutput, solutions,
+                lambda: Text(txtoutput).write(solutions, title_list=title_list),
+                'text', title_list)
     if do_notebook:
-        Notebook(nboutput).write(solutions)
+        with PROFILE.phase('notebook'):
+            manifest.update(
+                nboutput, solutions,
+                lambda: Notebook(nboutput).write(solutions),
+                'notebook')
     if do_separate:
-        sep = Path("separate")
-        sep.is_dir() or sep.mkdir()
-        for function in functions:
-            funpath = sep / f"{function.qual_name}.py"
-            with funpath.open('w') as f:
-                f.write(function.text(show_ref=False))
-                for sibling in function.siblings:
-                    f.write(sibling.text(show_ref=False))
-            print(f"(over)wrote {funpath}")
+        with PROFILE.phase('separate'):
+            sep = Path("separate")
+            sep.is_dir() or sep.mkdir()
+            for function in functions:
+                funpath = sep / f"{function.qual_name}.py"
+                group = [function] + function.siblings
+                def write_separate(funpath=funpath, group=group):
+                    changed = replace_file_with_string(
+                        funpath,
+                        "".join(sol.text(show_ref=False) for sol in group))
+                    BuildManifest.report(funpath, changed)
+                    return changed
+                manifest.update(funpath, group, write_separate, 'separate')
+    manifest.save()
+    if args.validate:
+        with PROFILE.phase('validation'):
+            validation = Validation(f"{output}-units", f"{output}-report.json")
+            validation.run(solutions, coursedir / "modules",
+                           jobs=args.jobs, timeout=args.timeout)
     stats = Stats(solutions, functions)
     stats.print_count(verbose=False)
+    if args.profile:
+        profile_path = f"{output}.profile.json"
+        PROFILE.dump(profile_path)
+        PROFILE.print_summary(profile_path)
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.pstats)
+        print(f"cProfile stats stored in {args.pstats}")
 
 if __name__ == '__main__':
     main()
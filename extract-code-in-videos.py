@@ -17,16 +17,32 @@ Run as follows:
 $ cd flotpython-course
 $ python ../flotpython-tools/extract-code-in-videos.py w?/w*-code-in-videos.md
 
+sequences whose markdown - and this script - have not changed since
+the previous run are not rendered again; this relies on a
+.code-in-videos.json manifest next to the outputs, e.g. in w1/;
+use --force to render everything
+
 """
 
 import re
+import os
+import json
+import hashlib
 from argparse import ArgumentParser
 from pathlib import Path
-from myst_parser.main import to_html
+from concurrent.futures import ProcessPoolExecutor
+from myst_parser.main import default_parser, MdParserConfig
 
 sequence_pattern = r"# w(?P<week>[0-9])s(?P<seq>[0-9])"
 sequence_matcher = re.compile(sequence_pattern)
 
+# in each output directory, remembers the hash
+# of the markdown used for each output file
+MANIFEST = ".code-in-videos.json"
+
+# the way outputs are produced is part of the hash
+SCRIPT = Path(__file__).read_bytes()
+
 header = """
 <style>
 .clipboard {
@@ -52,15 +68,43 @@ def sanitize(lines):
     return lines
 
 
-def save_sequence(week, seq, lines):
-    filename = f"w{week}/w{week}-s{seq}-av-code.html"
-    print(f"using {len(lines)} (markdown) lines to make {filename}")
-    text ="".join(sanitize(lines))
-    #print(text)
+# this is what to_html does, except that it creates a new parser each time
+# here we create one per process
+PARSER = None
+
+def render(text):
+    global PARSER
+    if PARSER is None:
+        PARSER = default_parser(MdParserConfig(renderer="html"))
+    return PARSER.render(text)
+
+
+def sequence_filename(week, seq):
+    return f"w{week}/w{week}-s{seq}-av-code.html"
+
+
+def save_sequence(filename, text):
     with Path(filename).open('w') as writer:
-        writer.write(f"<div class='clipboard'>{to_html(text)}</div>")
+        writer.write(f"<div class='clipboard'>{render(text)}</div>")
+
+
+def save_sequences(sequences):
+    """
+    render and save a list of (filename, text), typically for one week
+    """
+    for filename, text in sequences:
+        save_sequence(filename, text)
 
-def handle_week(markdown):
+
+def split_week(markdown):
+    """
+    returns a list of (filename, markdown text, number of lines)
+    for the sequences in that file
+    """
+    sequences = []
+    def flush(week, seq, lines):
+        nb_lines = len(lines)
+        sequences.append((sequence_filename(week, seq), "".join(sanitize(lines)), nb_lines))
     with open(markdown) as feed:
         lines = []
         week, seq = None, None
@@ -69,7 +113,7 @@ def handle_week(markdown):
                 # flush previous sequence if needed
                 if lines:
                     if week:
-                        save_sequence(week, seq, lines)
+                        flush(week, seq, lines)
                     # potential leak ?
                     else:
                         # allow empty lines
@@ -84,17 +128,81 @@ def handle_week(markdown):
                 # lines.append(line)
             else:
                 lines.append(line)
-        save_sequence(week, seq, lines)
+        if week:
+            flush(week, seq, lines)
         #print(f"EOF with week={week} seq={seq} and {len(lines)} lines")
+    return sequences
+
+
+def load_manifest(directory):
+    try:
+        with (Path(directory) / MANIFEST).open() as feed:
+            return json.load(feed)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(directory, manifest):
+    path = Path(directory) / MANIFEST
+    tmp = path.with_name(f"{MANIFEST}.{os.getpid()}.tmp")
+    with tmp.open('w') as writer:
+        json.dump(manifest, writer, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def digest(text):
+    """
+    the hash of a sequence markdown, and of this script
+    that has the header and the html wrapper
+    """
+    hasher = hashlib.sha1(SCRIPT)
+    hasher.update(header.encode())
+    hasher.update(text.encode())
+    return hasher.hexdigest()
 
 
 def main():
     parser = ArgumentParser()
+    parser.add_argument("-f", "--force", action='store_true', default=False,
+                        help="render all sequences, even the unchanged ones")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="render the weeks on that many processes")
     parser.add_argument("markdowns", nargs='+')
     args = parser.parse_args()
-    
+
+    # output directory -> its manifest, as a dict output name -> hash
+    manifests = {}
+    # the sequences that need to be rendered, grouped by week
+    weeks = []
+    unchanged = 0
     for markdown in args.markdowns:
-        handle_week(markdown)
+        todo = []
+        for filename, text, nb_lines in split_week(markdown):
+            path = Path(filename)
+            if path.parent not in manifests:
+                manifests[path.parent] = (
+                    {} if args.force else load_manifest(path.parent))
+            manifest = manifests[path.parent]
+            key = digest(text)
+            if manifest.get(path.name) == key and path.exists():
+                unchanged += 1
+                continue
+            print(f"using {nb_lines} (markdown) lines to make {filename}")
+            todo.append((filename, text))
+            manifest[path.name] = key
+        if todo:
+            weeks.append(todo)
+
+    if args.jobs <= 1:
+        for sequences in weeks:
+            save_sequences(sequences)
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            list(executor.map(save_sequences, weeks))
+    rendered = sum(len(sequences) for sequences in weeks)
+    print(f"{rendered} sequence(s) rendered, {unchanged} unchanged")
+    for directory, manifest in manifests.items():
+        save_manifest(directory, manifest)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""
+micro-benchmark for break_line in nbcustomexec.py
+
+compares it with the former, character-based, implementation
+on outputs of a few megabytes, and checks they give the same result
+"""
+
+import time
+import random
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from nbcustomexec import break_line
+
+
+def break_line_per_char(one_string, width):
+    """
+    the former implementation, that is quadratic
+    """
+    result = ""
+    counter = 0
+    for c in one_string:
+        if c == '\n':
+            result += c
+            counter = 0
+        elif counter < width:
+            result += c
+            counter += 1
+        else:
+            result += "ϟ\n  ϟ"
+            result += c
+            counter = 4
+    return result
+
+
+def sample_output(size, seed=0):
+    """
+    a mix of short lines, like a pandas frame, and very long
+    ones, like a big list printed in one go
+    """
+    rng = random.Random(seed)
+    lines = []
+    total = 0
+    while total < size:
+        if rng.random() < 0.8:
+            line = "x" * rng.randint(0, 120)
+        else:
+            line = repr(list(range(rng.randint(100, 5000))))
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+
+def timeit(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-w", "--width", type=int, default=75)
+    parser.add_argument("-n", "--no-reference", default=False,
+                        action='store_true',
+                        help="do not run the former implementation")
+    parser.add_argument("sizes", nargs='*', type=float, default=[0.1, 1, 4],
+                        help="sizes of the outputs, in megabytes")
+    args = parser.parse_args()
+
+    for megabytes in args.sizes:
+        output = sample_output(int(megabytes * 1024 * 1024))
+        result, elapsed = timeit(break_line, output, args.width)
+        message = f"{megabytes:6.1f} MB: break_line {elapsed:8.3f}s"
+        if not args.no_reference:
+            reference, ref_elapsed = timeit(
+                break_line_per_char, output, args.width)
+            status = "OK" if result == reference else "MISMATCH"
+            message += f" - per char {ref_elapsed:8.3f}s - {status}"
+        print(message)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+"""
+build the per-week pdfs, and the cumulative one, in parallel
+
+each pdf gets its own job directory under work/jobs/, that symlinks
+the shared stuff in work/ - notebooks .tex and figures - and has its own
+contents.tex, chapter files, and .aux; so the builds are independent from
+one another, and each of them only reruns xelatex as long as the .aux
+files keep on changing
+
+to be run from the pdf/ directory, like scopecontents.py
+"""
+
+import shutil
+import hashlib
+import subprocess
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import scopecontents
+
+# what a job produces by itself, and must not be shared between jobs
+# svg-inkscape/ is where the svg package has inkscape convert figures
+JOB_SPECIFIC = {'contents.tex', 'contents.d', 'includeonly.tex', 'jobs',
+                'svg-inkscape'}
+JOB_SPECIFIC_SUFFIXES = {'.aux', '.toc', '.out', '.log', '.pdf'}
+
+# the files whose changes mean latex needs another pass
+RERUN_PATTERNS = ('*.aux', '*.toc', '*.out')
+
+
+def shared_entries(workdir):
+    for path in Path(workdir).iterdir():
+        if path.name in JOB_SPECIFIC or path.suffix in JOB_SPECIFIC_SUFFIXES:
+            continue
+        if path.name.startswith('chapter-w') or path.name == 'Python.tex':
+            continue
+        yield path
+
+
+def prepare_job_dir(jobdir, workdir, python_tex):
+    """
+    symlink in jobdir everything it needs from workdir
+    and remove dangling links, e.g. to notebooks that went away,
+    as well as links to job-specific stuff left by older versions
+    """
+    jobdir.mkdir(parents=True, exist_ok=True)
+    for link in jobdir.iterdir():
+        if link.is_symlink() and (not link.exists() or link.name in JOB_SPECIFIC):
+            link.unlink()
+    targets = list(shared_entries(workdir)) + [python_tex]
+    for target in targets:
+        link = jobdir / target.name
+        if link.is_symlink() and link.resolve() == target.resolve():
+            continue
+        if link.is_symlink():
+            link.unlink()
+        link.symlink_to(target.resolve())
+
+
+def rerun_signature(jobdir):
+    hasher = hashlib.sha1()
+    for pattern in RERUN_PATTERNS:
+        for path in sorted(jobdir.glob(pattern)):
+            hasher.update(path.name.encode())
+            hasher.update(path.read_bytes())
+    return hasher.hexdigest()
+
+
+def run_xelatex(jobdir, max_passes):
+    """
+    run xelatex until the .aux files are stable
+
+    in nonstopmode, xelatex goes on after most errors and still produces
+    a pdf, but exits with a non-zero code; so this is only a warning
+
+    returns a tuple (number of passes, warning message or None)
+    """
+    # so that a pdf from a previous run is not mistaken for this one
+    (jobdir / 'Python.pdf').unlink(missing_ok=True)
+    warning = None
+    signature = rerun_signature(jobdir)
+    for passes in range(1, max_passes+1):
+        completed = subprocess.run(
+            ['xelatex', '--shell-escape', '-interaction=nonstopmode', 'Python'],
+            cwd=jobdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if completed.returncode != 0:
+            warning = f"xelatex reported errors, see {jobdir}/Python.log"
+        new_signature = rerun_signature(jobdir)
+        if new_signature == signature:
+            return passes, warning
+        signature = new_signature
+    return max_passes, warning
+
+
+def build_pdf(job):
+    """
+    job is a dict with keys
+    name, weeks, first_chapter, workdir, python_tex, titles, force, max_passes
+
+    returns a tuple (pdf name, success, message)
+    """
+    pdf = Path(f"{job['name']}.pdf")
+    jobdir = Path(job['workdir']) / 'jobs' / job['name']
+    prepare_job_dir(jobdir, Path(job['workdir']), Path(job['python_tex']))
+    chapters = scopecontents.write_output(
+        job['weeks'], job['first_chapter'], jobdir / 'contents.tex',
+        jobdir, job['titles'])
+    scopecontents.write_depfile(chapters, jobdir / 'contents.tex')
+    scopecontents.write_includeonly([], jobdir)
+    if not job['force'] and scopecontents.up_to_date(pdf, chapters, jobdir):
+        return pdf, True, "up to date"
+    passes, warning = run_xelatex(jobdir, job['max_passes'])
+    if not (jobdir / 'Python.pdf').exists():
+        return pdf, False, f"no pdf produced, see {jobdir}/Python.log"
+    shutil.copyfile(jobdir / 'Python.pdf', pdf)
+    message = f"built with {passes} pass(es)"
+    if warning:
+        message += f" - WARNING {warning}"
+    return pdf, True, message
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-u', '--upto', type=int, default=9,
+                        help='build Python-w1.pdf to Python-w<upto>.pdf,'
+                             ' and Python-w1-to-w<upto>.pdf')
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help='build that many pdfs in parallel')
+    parser.add_argument('-w', '--work-dir', dest='workdir', default="work")
+    parser.add_argument('-p', '--max-passes', type=int, default=4,
+                        help='never run xelatex more than that many times on one pdf')
+    parser.add_argument('-f', '--force', action='store_true', default=False,
+                        help='build even if the pdf is more recent than its dependencies')
+    parser.add_argument('weeks', nargs='*', type=int,
+                        help='only build these weeks, and no cumulative pdf')
+    args = parser.parse_args()
+
+    titles = scopecontents.read_titles()
+    common = dict(workdir=args.workdir, python_tex=str(Path("Python.tex").resolve()),
+                  titles=titles, force=args.force, max_passes=args.max_passes)
+    weeks = args.weeks or range(1, args.upto+1)
+    jobs = [dict(name=f"Python-w{week}", weeks=[str(week)], first_chapter=week,
+                 **common)
+            for week in weeks]
+    if not args.weeks and args.upto > 1:
+        jobs.append(dict(name=f"Python-w1-to-w{args.upto}",
+                         weeks=[str(week) for week in weeks], first_chapter=1,
+                         **common))
+    # the cumulative one is the longest, better start it first
+    jobs.reverse()
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for pdf, success, message in executor.map(build_pdf, jobs):
+            print(f"{pdf}: {message}")
+            if not success:
+                failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -15,12 +15,23 @@ magic)
 
 """
 
+import csv
+import json
+import time
+import shutil
+import hashlib
+import filecmp
 from pathlib import Path
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from queue import Queue, Empty
+from threading import Thread
 
 import nbformat
 import jupytext
 from nbconvert.preprocessors import Preprocessor, ExecutePreprocessor
+from nbclient.exceptions import CellExecutionError
+from jupyter_client.manager import AsyncKernelManager
+from jupyter_core.utils import run_sync
 
 
 ##########
@@ -72,9 +83,47 @@ REPLACE_ALL = '*all*'
 # in a replacement means the whole cell gets rewritten
 
 
+# a notebook can declare the files or directories its outputs depend upon
+# in its (notebook-level) metadata, as a list of paths relative to exec-dir
+# e.g. "latex-inputs": ["data/marine-e1-ext.json"]
+# they are taken into account by the execution cache
+INPUTS_IN_METADATA = "latex-inputs"
+
+# per-cell budgets; a cell that exceeds its budget is recorded
+# in the summary printed at the end
+# * the timeout is in seconds; the cell gets interrupted
+#   and execution goes on with the next cell
+CELL_TIMEOUT = "latex-timeout"
+# * in bytes; outputs beyond that size are truncated
+CELL_MAX_OUTPUT = "latex-max-output"
+# * in megabytes; this is the peak memory of the kernel process,
+#   so it is checked after the cell has run and is only reported;
+#   a notebook with such a budget gets a fresh kernel, so that
+#   the peak does not come from a previous notebook
+CELL_MAX_RSS = "latex-max-rss"
+
+# with the cell cache, a cell with this key in its metadata is deemed pure,
+# i.e. it does not change the kernel state, so when its outputs come from
+# the cache it does not need to be replayed in the kernel
+PURE_CELL_IN_METADATA = "latex-pure"
+
 # all annotations will mention this string
 MARKER = "auto-exec-for-latex"
 
+# evaluated in the kernel to get its peak memory usage, in megabytes
+KERNEL_PEAK_RSS = (
+    "__import__('resource').getrusage(__import__('resource').RUSAGE_SELF).ru_maxrss"
+    " / (2**20 if __import__('sys').platform == 'darwin' else 2**10)")
+
+# when a kernel is reused for another notebook, this is run
+# first, silently and without counting as an execution, so that
+# the notebook starts afresh, with In[1] and from exec_dir
+# (chdir comes first, as the previous directory may be gone)
+RESET_KERNEL = """
+__import__('os').chdir({exec_dir!r})
+get_ipython().reset(new_session=True, aggressive=True)
+"""
+
 ##########
 
 
@@ -89,6 +138,72 @@ def save_notebook(notebook, path: Path):
         nbformat.write(notebook, output)
 
 
+def output_size(output):
+    "in bytes, roughly"
+    if output.output_type == 'stream':
+        return len(output.text.encode())
+    if output.output_type == 'error':
+        return sum(len(line.encode()) for line in output.traceback)
+    return sum(len(str(value).encode())
+               for value in output.get('data', {}).values())
+
+
+def truncate_outputs(outputs, max_bytes):
+    """
+    returns a tuple (outputs, total size)
+
+    if the total exceeds max_bytes, outputs get truncated: the ones that
+    fit are kept, a stream output is cut where the budget runs out,
+    the rest is dropped, and a note is added - the note is counted
+    in the budget, unless it does not fit in there by itself
+    """
+    total = sum(output_size(output) for output in outputs)
+    if total <= max_bytes:
+        return outputs, total
+    note = nbformat.v4.new_output(
+        'stream', name='stderr',
+        text=f"\n[{MARKER}: truncated, {total} > {max_bytes} bytes]\n")
+    max_bytes = max(0, max_bytes - output_size(note))
+    kept, used = [], 0
+    for output in outputs:
+        size = output_size(output)
+        if used + size <= max_bytes:
+            kept.append(output)
+            used += size
+            continue
+        room = max_bytes - used
+        if output.output_type == 'stream' and room > 0:
+            output.text = output.text.encode()[:room].decode(errors='ignore')
+            kept.append(output)
+        break
+    kept.append(note)
+    return kept, total
+
+
+# how long lines are wrapped in outputs
+CONTINUATION = "ϟ\n  ϟ"
+
+def break_line(one_string, width):
+    """
+    Input is a single string with possibly several \n
+
+    each line longer than width is cut into a first chunk of width
+    characters, and then chunks of width-3 characters, to make up
+    for the 3 characters of the CONTINUATION marker at their beginning
+
+    works line by line with slicing, so this is linear
+    """
+    step = max(1, width - 3)
+    def break_one(line):
+        if len(line) <= width:
+            return line
+        chunks = [line[:width]]
+        chunks.extend(line[start:start+step]
+                      for start in range(width, len(line), step))
+        return CONTINUATION.join(chunks)
+    return "\n".join(break_one(line) for line in one_string.split("\n"))
+
+
 class StripPreprocessor(Preprocessor):
 
     def preprocess(self, nb, resources):
@@ -101,6 +216,144 @@ class StripPreprocessor(Preprocessor):
 
 class CustomExecPreprocessor(ExecutePreprocessor):
 
+    def preprocess(self, nb, resources=None, km=None, cell_cache=None):
+        """
+        km is an optional kernel manager; if it already has a running
+        kernel, that kernel gets reset before the notebook is executed
+
+        cell_cache is an optional CellCache instance
+        """
+        self.needs_reset = km is not None and km.has_kernel
+        self.cell_cache = cell_cache
+        # a list of dicts, one per budget violation
+        self.violations = []
+        # a list of dicts, one per executed or cached code cell
+        self.timings = []
+        # from here to the first cell, i.e. mostly kernel startup
+        self.started = time.perf_counter()
+        self.startup = None
+        try:
+            result = super().preprocess(nb, resources, km)
+        finally:
+            # nbclient leaves the client alone when the kernel is not its own
+            if self.kc is not None:
+                self.kc.stop_channels()
+                self.kc = None
+        self.elapsed = time.perf_counter() - self.started
+        if cell_cache:
+            cell_cache.save()
+        return result
+
+    def record_timing(self, cell, cell_index, seconds, cached):
+        """
+        store timing and output size in the cell metadata
+        and in self.timings
+        """
+        timing = dict(seconds=round(seconds, 3),
+                      output_bytes=sum(output_size(output)
+                                       for output in cell.outputs),
+                      cached=cached)
+        cell.metadata[MARKER] = timing
+        self.timings.append(dict(cell=cell_index, **timing))
+
+    def report(self):
+        """
+        what this notebook execution has to say, as a dict
+        """
+        return dict(seconds=round(self.elapsed, 3),
+                    startup=round(self.startup or 0., 3),
+                    cells=self.timings,
+                    violations=self.violations)
+
+    def reset_kernel(self):
+        exec_dir = self.resources.get('metadata', {}).get('path') or '.'
+        msg_id = self.kc.execute(
+            RESET_KERNEL.format(exec_dir=str(Path(exec_dir).resolve())),
+            silent=True, store_history=False)
+        self.wait_for_reply(msg_id)
+
+    # global budgets, that cells can override in their metadata
+    max_output = None
+    max_rss = None
+
+    def kernel_peak_rss(self):
+        "in megabytes"
+        msg_id = self.kc.execute(
+            "", silent=True, store_history=False,
+            user_expressions={'rss': KERNEL_PEAK_RSS})
+        reply = self.wait_for_reply(msg_id)
+        try:
+            return float(
+                reply['content']['user_expressions']['rss']['data']['text/plain'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def violation(self, cell_index, budget, limit, actual):
+        print(f"cell {cell_index}: {budget} budget exceeded: {actual} > {limit}")
+        self.violations.append(dict(
+            cell=cell_index, budget=budget, limit=limit, actual=actual))
+
+    def execute_within_budget(self, cell, resources, cell_index):
+        """
+        run the cell through the superclass, with its own timeout if set;
+        a cell that times out is interrupted and recorded as a violation
+        """
+        timeout = cell.metadata.get(CELL_TIMEOUT, self.timeout)
+        if timeout is None:
+            return ExecutePreprocessor.preprocess_cell(
+                self, cell, resources, cell_index)
+        saved = self.timeout, self.interrupt_on_timeout
+        self.timeout, self.interrupt_on_timeout = timeout, True
+        start = time.perf_counter()
+        try:
+            return ExecutePreprocessor.preprocess_cell(
+                self, cell, resources, cell_index)
+        except CellExecutionError as exc:
+            # an interrupted cell shows up as a KeyboardInterrupt
+            elapsed = time.perf_counter() - start
+            if exc.ename != 'KeyboardInterrupt' or elapsed < timeout:
+                raise
+            self.violation(cell_index, 'timeout', timeout, round(elapsed, 1))
+            return cell, resources
+        finally:
+            self.timeout, self.interrupt_on_timeout = saved
+
+    def check_budgets(self, cell, cell_index):
+        if cell.cell_type != 'code':
+            return
+        max_output = cell.metadata.get(CELL_MAX_OUTPUT, self.max_output)
+        if max_output is not None:
+            cell.outputs, total = truncate_outputs(cell.outputs, max_output)
+            if total > max_output:
+                self.violation(cell_index, 'output', max_output, total)
+        max_rss = cell.metadata.get(CELL_MAX_RSS, self.max_rss)
+        if max_rss is not None:
+            rss = self.kernel_peak_rss()
+            # only report the cell that crosses the line
+            if rss is not None and rss > max_rss and not any(
+                    v['budget'] == 'rss' for v in self.violations):
+                self.violation(cell_index, 'rss', max_rss, round(rss))
+
+    def replay_cached_prefix(self):
+        """
+        when leaving the cached prefix, re-run its code in the kernel
+        so that the state is right, and set the execution counter
+        to where the cached cells left it
+        """
+        cache = self.cell_cache
+        for code in cache.pending:
+            msg_id = self.kc.execute(code, silent=True, store_history=False)
+            reply = self.wait_for_reply(msg_id)
+            if reply and reply['content']['status'] != 'ok':
+                print(f"WARNING: could not replay cached cell\n{code}")
+        cache.pending = []
+        if cache.next_count is not None:
+            msg_id = self.kc.execute(
+                f"get_ipython().execution_count = {cache.next_count}",
+                silent=True, store_history=False)
+            self.wait_for_reply(msg_id)
+            cache.next_count = None
+
     def do_replacement(self, incoming, replacements):
         """
         performs replacements as specified in replacements
@@ -135,6 +388,13 @@ class CustomExecPreprocessor(ExecutePreprocessor):
 
     def preprocess_cell(self, cell, resources, cell_index):
 
+        if self.startup is None:
+            self.startup = time.perf_counter() - self.started
+
+        if self.needs_reset:
+            self.reset_kernel()
+            self.needs_reset = False
+
         # even if we skip a cell, we need to comply with the protocol
         # implemented in the superclass, which expects
         ignored_result = cell, resources
@@ -166,32 +426,14 @@ class CustomExecPreprocessor(ExecutePreprocessor):
                            + f"\n##########"
                            )
 
-        def break_line(one_string, width):
-            """
-            Input is a single string with possibly several \n
-            """
-            result = ""
-            counter = 0
-            for c in one_string:
-                if c == '\n':
-                    result += c
-                    counter = 0
-                elif counter < width:
-                    result += c
-                    counter += 1
-                else:
-                    result += "ϟ\n  ϟ"
-                    result += c
-                    counter = 4
-            return result
-
         def break_lines_in_output(cell, width):
             if cell.cell_type != 'code':
                 return
             for output in cell.outputs:
-                if output.output_type == 'execute_result':
-                    output.data['text/plain'] = break_line(
-                        output.data['text/plain'], width)
+                if output.output_type in ('execute_result', 'display_data'):
+                    if 'text/plain' in output.data:
+                        output.data['text/plain'] = break_line(
+                            output.data['text/plain'], width)
                 elif output.output_type == 'stream':
                     output.text = break_line(
                         output.text, width)
@@ -201,7 +443,7 @@ class CustomExecPreprocessor(ExecutePreprocessor):
 
         initial_code = None
 
-        source = cell.source
+        original_code = source = cell.source
         for ignore in IGNORE_IF_PRESENT_IN_SOURCE:
             if ignore in source:
                 mark_ignored(cell)
@@ -230,15 +472,37 @@ class CustomExecPreprocessor(ExecutePreprocessor):
                 replacements = metadata[key]
                 cell.source = self.do_replacement(cell.source, replacements)
 
+        cache = self.cell_cache if cell.cell_type == 'code' else None
+        if cache:
+            cache.chain(cell, original_code, metadata)
+            entry = cache.lookup()
+            if entry:
+                if PURE_CELL_IN_METADATA not in metadata:
+                    cache.pending.append(cell.source)
+                cell.source = entry['source']
+                cell.outputs = [nbformat.from_dict(output)
+                                for output in entry['outputs']]
+                cell.execution_count = entry['execution_count']
+                if entry['execution_count'] is not None:
+                    cache.next_count = entry['execution_count'] + 1
+                cache.record(cell)
+                self.record_timing(cell, cell_index, 0., True)
+                return cell, resources
+            self.replay_cached_prefix()
+
         # print(f"{cell=}, {metadata=}")
-        execution_result = ExecutePreprocessor.preprocess_cell(
-            self, cell, resources, cell_index)
+        start = time.perf_counter()
+        execution_result = self.execute_within_budget(
+            cell, resources, cell_index)
+        seconds = time.perf_counter() - start
 
         # post-process executed cell
         if initial_code is not None:
             mark_substituted(cell, initial_code)
 
         break_lines_in_output(cell, 75)
+        # once wrapped, so that the outputs as saved fit in the budget
+        self.check_budgets(cell, cell_index)
 
         # perform replacements in output as well
         # nope, that's more complicated than that
@@ -246,9 +510,361 @@ class CustomExecPreprocessor(ExecutePreprocessor):
         #     cell.output = self.do_replacement(
         #        cell.output, metadata[CODE_REPLACEMENT])
 
+        if cache:
+            cache.record(cell)
+        if cell.cell_type == 'code':
+            self.record_timing(cell, cell_index, seconds, False)
+
         return execution_result
 
 
+class ExecCache:
+    """
+    a cache of executed notebooks, keyed on a hash of everything
+    that the execution depends upon, i.e.
+    * this very script
+    * the type and source of all cells, as loaded - i.e. normalized -
+      by jupytext, so it does not matter if the notebook is .ipynb/.py/.md
+    * the cell metadata that we interpret here - the latex-* keys
+    * the declared input files or directories - the ones given on the
+      command line, and the ones listed under INPUTS_IN_METADATA
+      in the notebook metadata; relative paths are from exec_dir
+
+    unlike modification times, this survives git checkouts and
+    branch switches; several versions are kept for each notebook
+    """
+
+    # how many versions to keep for each notebook
+    KEEP = 3
+
+    def __init__(self, directory, exec_dir, inputs):
+        self.directory = Path(directory)
+        self.exec_dir = Path(exec_dir)
+        self.inputs = inputs
+        # input path -> hash, computed at most once per run
+        self.input_hashes = {}
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    # what running the notebooks may produce in their inputs
+    # e.g. when importing from modules/corrections; not part of the hash
+    IGNORED_DIRS = {'__pycache__'}
+    IGNORED_SUFFIXES = {'.pyc', '.pyo'}
+
+    def ignored(self, path, top):
+        parts = path.relative_to(top).parts
+        return (path.suffix in self.IGNORED_SUFFIXES
+                or any(part in self.IGNORED_DIRS or part.startswith('.')
+                       for part in parts))
+
+    def hash_input(self, name):
+        path = self.exec_dir / name
+        if path not in self.input_hashes:
+            hasher = hashlib.sha1()
+            if path.is_dir():
+                files = sorted(p for p in path.rglob("*")
+                               if p.is_file() and not self.ignored(p, path))
+            elif path.is_file():
+                files = [path]
+            else:
+                print(f"WARNING: declared input {path} not found")
+                files = []
+            for file in files:
+                hasher.update(str(file.relative_to(path.parent)).encode())
+                hasher.update(file.read_bytes())
+            self.input_hashes[path] = hasher.hexdigest()
+        return self.input_hashes[path]
+
+    def inputs_key(self, notebook):
+        """
+        the part of the key that does not depend on the cells
+        notebook is as returned by load_notebook()
+        """
+        hasher = hashlib.sha1(Path(__file__).read_bytes())
+        inputs = list(self.inputs) + notebook.metadata.get(INPUTS_IN_METADATA, [])
+        for name in inputs:
+            hasher.update(name.encode())
+            hasher.update(self.hash_input(name).encode())
+        return hasher.hexdigest()
+
+    def key(self, notebook):
+        hasher = hashlib.sha1(self.inputs_key(notebook).encode())
+        for cell in notebook.cells:
+            metadata = {key: value for key, value in cell.metadata.items()
+                        if key.startswith('latex-')}
+            hasher.update(json.dumps(
+                [cell.cell_type, cell.source, metadata],
+                sort_keys=True).encode())
+        return hasher.hexdigest()
+
+    def cell_cache(self, stem, notebook):
+        return CellCache(self.directory / f"{stem}.cells.json",
+                         self.inputs_key(notebook))
+
+    def cached(self, stem, key):
+        return self.directory / f"{stem}-{key}.ipynb"
+
+    def restore(self, stem, key, output):
+        """
+        if found in the cache, copy that version in output
+        output is left untouched if it is already the right version
+
+        returns True on a cache hit
+        """
+        cached = self.cached(stem, key)
+        if not cached.exists():
+            return False
+        if not output.exists() or not filecmp.cmp(cached, output, shallow=False):
+            shutil.copyfile(cached, output)
+        return True
+
+    def store(self, stem, key, output):
+        shutil.copyfile(output, self.cached(stem, key))
+        # one character per hex digit in the key
+        versions = sorted(self.directory.glob(f"{stem}-{'?' * len(key)}.ipynb"),
+                          key=lambda path: path.stat().st_mtime)
+        for old in versions[:-self.KEEP]:
+            old.unlink()
+
+
+class CellCache:
+    """
+    opt-in, cell-level memoization for one notebook
+
+    each code cell is identified by a chain hash, that covers its type,
+    source, substituted source, and latex-* metadata, plus the hash of
+    the previous code cell - so the chain starts with a seed that
+    stands for the script and inputs
+
+    as long as the chain is unchanged, cells get their outputs from
+    the cache instead of being executed; at the first changed cell,
+    the code of the cached prefix is replayed silently in the kernel
+    so that its state is right - except for cells marked with
+    PURE_CELL_IN_METADATA - and regular execution resumes from there
+    """
+
+    def __init__(self, path, seed):
+        self.path = Path(path)
+        self.hash = seed
+        try:
+            with self.path.open() as feed:
+                self.entries = json.load(feed)
+        except (FileNotFoundError, ValueError):
+            self.entries = []
+        # the entries for this run
+        self.new_entries = []
+        # still in the unchanged prefix
+        self.valid = True
+        # code to replay when leaving the prefix
+        self.pending = []
+        self.next_count = None
+
+    def chain(self, cell, original_code, metadata):
+        hasher = hashlib.sha1(self.hash.encode())
+        hasher.update(json.dumps(
+            [cell.cell_type, original_code, cell.source,
+             {key: value for key, value in metadata.items()
+              if key.startswith('latex-')}],
+            sort_keys=True).encode())
+        self.hash = hasher.hexdigest()
+
+    def lookup(self):
+        """
+        to be called after chain(); returns the cached entry for that cell
+        or None, in which case the cell needs to be executed for real
+        """
+        index = len(self.new_entries)
+        if (self.valid and index < len(self.entries)
+                and self.entries[index]['hash'] == self.hash):
+            return self.entries[index]
+        self.valid = False
+        return None
+
+    def record(self, cell):
+        self.new_entries.append(dict(
+            hash=self.hash, source=cell.source,
+            outputs=cell.outputs, execution_count=cell.execution_count))
+
+    def save(self):
+        with self.path.open('w') as output:
+            json.dump(self.new_entries, output)
+
+
+# the global budgets, that cells can override in their metadata
+DEFAULT_BUDGETS = dict(timeout=600, max_output=None, max_rss=None)
+
+
+def check_budgets_metadata(notebook):
+    """
+    raise ValueError if a cell has a budget that is not a positive number
+    """
+    for index, cell in enumerate(notebook.cells):
+        for key in (CELL_TIMEOUT, CELL_MAX_OUTPUT, CELL_MAX_RSS):
+            value = cell.metadata.get(key)
+            if value is None:
+                continue
+            if (isinstance(value, bool) or not isinstance(value, (int, float))
+                    or value <= 0):
+                raise ValueError(f"cell {index}: {key} should be"
+                                 f" a positive number, not {value!r}")
+
+
+def has_rss_budget(notebook, budgets):
+    return budgets['max_rss'] is not None or any(
+        CELL_MAX_RSS in cell.metadata for cell in notebook.cells)
+
+
+def execute_notebook(notebook, exec_dir, output_path, verbose, km=None,
+                     exec_cache=None, budgets=None):
+    """
+    strip and execute one notebook, and save it in output_path
+
+    km is an optional kernel manager, whose kernel is started
+    if needed, and then left running; it is restarted though
+    if the notebook has a memory budget
+
+    exec_cache is an optional ExecCache, to be given for using
+    the cell-level cache
+
+    budgets is a dict like DEFAULT_BUDGETS
+
+    returns the execution report, see CustomExecPreprocessor.report()
+    """
+    budgets = budgets or DEFAULT_BUDGETS
+    path = Path(notebook)
+    notebook = load_notebook(path)
+    cell_cache = exec_cache.cell_cache(path.stem, notebook) if exec_cache else None
+    stem = path.stem
+    output = output_path / f"{stem}.ipynb"
+    if verbose:
+        print(f"{path} -> {output}")
+    resources = {'metadata': {'path': exec_dir}}
+    stripproc = StripPreprocessor()
+    notebook, resources = stripproc.preprocess(notebook, resources)
+    check_budgets_metadata(notebook)
+    # the peak memory of a warm kernel is that of all its past notebooks
+    if km is not None and km.has_kernel and has_rss_budget(notebook, budgets):
+        run_sync(km.restart_kernel)(now=True, cwd=str(exec_dir))
+    execproc = CustomExecPreprocessor(timeout=budgets['timeout'],
+                                      kernel_name='python3')
+    execproc.max_output = budgets['max_output']
+    execproc.max_rss = budgets['max_rss']
+    notebook, resources = execproc.preprocess(notebook, resources, km=km,
+                                              cell_cache=cell_cache)
+    save_notebook(notebook, output)
+    return execproc.report()
+
+
+def private_exec_dir(exec_dir, scratch, stem):
+    """
+    a directory of its own for one notebook, that symlinks everything
+    in exec_dir; this way notebooks that run at the same time can create
+    files - at the top level - without stepping on each other's toes
+    """
+    private = Path(scratch) / stem
+    shutil.rmtree(private, ignore_errors=True)
+    private.mkdir(parents=True)
+    for target in Path(exec_dir).iterdir():
+        (private / target.name).symlink_to(target.resolve())
+    return private
+
+
+def execute_pool(notebooks, exec_dir, output_path, verbose, jobs,
+                 exec_cache=None, budgets=None):
+    """
+    execute notebooks on a pool of jobs warm kernels
+
+    each kernel is owned by a thread that keeps on picking the next
+    notebook in line; the kernel is reset - not restarted - in between;
+    with several kernels, each notebook runs in its own private_exec_dir()
+
+    exec_cache and budgets are passed along to execute_notebook
+
+    returns a tuple with
+    * the list of notebooks that failed
+    * the list of execution reports, each tagged with its notebook
+    """
+    queue = Queue()
+    for notebook in notebooks:
+        queue.put(notebook)
+    failed = []
+    reports = []
+    jobs = min(jobs, len(notebooks))
+    scratch = output_path / ".execdirs"
+
+    def worker():
+        km = AsyncKernelManager(kernel_name='python3')
+        try:
+            while True:
+                try:
+                    notebook = queue.get_nowait()
+                except Empty:
+                    return
+                stem = Path(notebook).stem
+                notebook_dir = (private_exec_dir(exec_dir, scratch, stem)
+                                if jobs > 1 else exec_dir)
+                try:
+                    report = execute_notebook(
+                        notebook, notebook_dir, output_path,
+                        verbose, km, exec_cache, budgets)
+                    reports.append(dict(notebook=notebook, **report))
+                except Exception as exc:            # pylint: disable=w0703
+                    print(f"{notebook}: execution failed - {exc}")
+                    failed.append(notebook)
+                    # an output from a previous run would be misleading
+                    (output_path / f"{stem}.ipynb").unlink(missing_ok=True)
+                    # start over with a fresh kernel; a shut down kernel
+                    # manager cannot be reused, its zmq context is gone
+                    if km.has_kernel:
+                        run_sync(km.shutdown_kernel)(now=True)
+                    km = AsyncKernelManager(kernel_name='python3')
+                finally:
+                    if notebook_dir != exec_dir:
+                        shutil.rmtree(notebook_dir, ignore_errors=True)
+        finally:
+            if km.has_kernel:
+                run_sync(km.shutdown_kernel)(now=True)
+
+    threads = [Thread(target=worker) for _ in range(jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    shutil.rmtree(scratch, ignore_errors=True)
+    return failed, reports
+
+
+def save_report(reports, path):
+    """
+    in json, one entry per notebook with all its cells
+    in csv, one line per cell
+    """
+    if path.suffix != '.csv':
+        with path.open('w') as output:
+            json.dump(reports, output, indent=1)
+    else:
+        columns = ['notebook', 'cell', 'seconds', 'output_bytes', 'cached']
+        with path.open('w', newline='') as output:
+            writer = csv.DictWriter(output, fieldnames=columns)
+            writer.writeheader()
+            for report in reports:
+                for timing in report['cells']:
+                    writer.writerow(dict(notebook=report['notebook'], **timing))
+    print(f"execution report stored in {path}")
+
+
+def print_slowest(reports, top):
+    total = sum(report['seconds'] for report in reports)
+    startup = sum(report['startup'] for report in reports)
+    print(f"{len(reports)} notebook(s) executed in {total:.1f}s"
+          f" - including {startup:.1f}s to get kernels ready")
+    cells = sorted(((timing['seconds'], report['notebook'], timing['cell'])
+                    for report in reports for timing in report['cells']),
+                   reverse=True)
+    print(f"top {top} slowest cells:")
+    for seconds, notebook, cell in cells[:top]:
+        print(f"{seconds:8.2f}s {notebook} cell {cell}")
+
+
 def main():
     parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
     parser.add_argument("-v", "--verbose", default=False, action='store_true',
@@ -257,6 +873,37 @@ def main():
                         help="Directory to execute in")
     parser.add_argument("-d", "--output-dir", default="work",
                         help="Directory to store notebooks in")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of kernels to run notebooks on")
+    parser.add_argument("-i", "--input", dest='inputs', action='append',
+                        default=[],
+                        help="A file or directory that all notebooks depend upon,"
+                             " relative to exec-dir; can be repeated")
+    parser.add_argument("-c", "--cache-dir", default=None,
+                        help="Where to cache executed notebooks;"
+                             " default is .execcache/ in output-dir")
+    parser.add_argument("-n", "--no-cache", default=False, action='store_true',
+                        help="Execute all notebooks, regardless of the cache")
+    parser.add_argument("-C", "--cell-cache", default=False, action='store_true',
+                        help="In a notebook that needs to run, reuse the outputs"
+                             " of the cells before the first changed one")
+    parser.add_argument("-t", "--timeout", type=int,
+                        default=DEFAULT_BUDGETS['timeout'],
+                        help="Timeout for each cell, in seconds, after which"
+                             " it is interrupted; can be set per cell with "
+                             + CELL_TIMEOUT)
+    parser.add_argument("--max-output", type=int, default=None,
+                        help="Outputs of a cell beyond that many bytes are truncated;"
+                             " can be set per cell with " + CELL_MAX_OUTPUT)
+    parser.add_argument("--max-rss", type=int, default=None,
+                        help="Report cells after which the kernel uses more than"
+                             " that many megabytes; can be set per cell with "
+                             + CELL_MAX_RSS)
+    parser.add_argument("-r", "--report", default=None,
+                        help="Store timings for all notebooks and cells in that file;"
+                             " in csv if it ends with .csv, in json otherwise")
+    parser.add_argument("--top", type=int, default=10,
+                        help="Show that many slowest cells at the end")
     parser.add_argument("notebooks", nargs='+')
 
     args = parser.parse_args()
@@ -268,7 +915,6 @@ def main():
     if not exec_path.is_dir():
         print(f"Could not create exec dir {exec_path} - exiting")
         exit(1)
-    resources = {'metadata': {'path': args.exec_dir}}
 
     output_path = Path(args.output_dir)
     if not output_path.is_dir():
@@ -278,18 +924,44 @@ def main():
         print(f"Could not create output dir {output_path} - exiting")
         exit(1)
 
+    cache = ExecCache(args.cache_dir or output_path / ".execcache",
+                      exec_path, args.inputs)
+    keys = {}
+    to_execute = []
     for notebook in args.notebooks:
         path = Path(notebook)
-        notebook = load_notebook(path)
-        stem = path.stem
-        output = output_path / f"{stem}.ipynb"
-        if args.verbose:
-            print(f"{path} -> {output}")
-        stripproc = StripPreprocessor()
-        notebook, resources = stripproc.preprocess(notebook, resources)
-        execproc = CustomExecPreprocessor(timeout=600, kernel_name='python3')
-        notebook, resources = execproc.preprocess(notebook, resources)
-        save_notebook(notebook, output)
+        output = output_path / f"{path.stem}.ipynb"
+        keys[notebook] = cache.key(load_notebook(path))
+        if not args.no_cache and cache.restore(path.stem, keys[notebook], output):
+            print(f"{output} OK (cached)")
+            continue
+        to_execute.append(notebook)
+
+    budgets = dict(timeout=args.timeout, max_output=args.max_output,
+                   max_rss=args.max_rss)
+    failed, reports = execute_pool(
+        to_execute, args.exec_dir, output_path, args.verbose, args.jobs,
+        cache if args.cell_cache else None, budgets)
+    # keep the order of the command line
+    reports.sort(key=lambda report: args.notebooks.index(report['notebook']))
+    if args.report:
+        save_report(reports, Path(args.report))
+    if args.top and reports:
+        print_slowest(reports, args.top)
+    violations = [dict(notebook=report['notebook'], **violation)
+                  for report in reports for violation in report['violations']]
+    for notebook in to_execute:
+        if notebook not in failed:
+            stem = Path(notebook).stem
+            cache.store(stem, keys[notebook], output_path / f"{stem}.ipynb")
+    if violations:
+        print(f"{len(violations)} budget violation(s):")
+        for violation in violations:
+            print(f"    {violation['notebook']} cell {violation['cell']}: "
+                  f"{violation['budget']} {violation['actual']} > {violation['limit']}")
+    if failed:
+        print(f"{len(failed)} notebook(s) failed: {' '.join(failed)}")
+        exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+"""
+convert executed notebooks into the .tex fragments that Python.tex includes
+
+this does in a single process what used to take 3 steps per notebook:
+* jupyter nbconvert --to latex
+* striplatex.py
+* sed to fix includesvg
+so that each notebook is read once, and its .tex file is written once
+"""
+
+import re
+import io
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from nbconvert import LatexExporter
+from nbconvert.writers import FilesWriter
+
+# striplatex.py sits in this same directory
+from striplatex import strip_latex
+
+# striplatex turns .svg into .png everywhere, which is wrong
+# for includesvg that expects no extension at all
+INCLUDESVG_PNG = re.compile(r'(includesvg\{.*)\.png')
+
+
+def fix_includesvg(latex):
+    return INCLUDESVG_PNG.sub(r'\1', latex)
+
+
+# one exporter per process, as it's somewhat expensive to create
+EXPORTER = None
+
+def exporter():
+    global EXPORTER
+    if EXPORTER is None:
+        EXPORTER = LatexExporter()
+    return EXPORTER
+
+
+def convert_notebook(notebook):
+    """
+    convert one executed notebook into a .tex file in the same directory
+    figures go into the <stem>_files/ subdir, like with nbconvert
+
+    returns a tuple (notebook, elapsed seconds, error message or None)
+    """
+    start = time.perf_counter()
+    path = Path(notebook)
+    stem = path.stem
+    try:
+        resources = dict(unique_key=stem,
+                         output_files_dir=f"{stem}_files")
+        latex, resources = exporter().from_filename(str(path), resources=resources)
+        stripped = io.StringIO()
+        strip_latex(io.StringIO(latex), stripped, stem)
+        latex = fix_includesvg(stripped.getvalue())
+        writer = FilesWriter(build_directory=str(path.parent))
+        writer.write(latex, resources, notebook_name=stem)
+        return notebook, time.perf_counter() - start, None
+    except Exception as exc:
+        # do not leave a half-baked .tex that would be deemed up-to-date
+        path.with_suffix('.tex').unlink(missing_ok=True)
+        return notebook, time.perf_counter() - start, f"{type(exc).__name__}: {exc}"
+
+
+def needs_conversion(notebook):
+    tex = Path(notebook).with_suffix('.tex')
+    return not tex.exists() or tex.stat().st_mtime < Path(notebook).stat().st_mtime
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Convert that many notebooks in parallel")
+    parser.add_argument("-f", "--force", action='store_true', default=False,
+                        help="Convert even if the .tex is newer than the notebook")
+    parser.add_argument("-v", "--verbose", action='store_true', default=False)
+    parser.add_argument("notebooks", nargs='+',
+                        help="executed notebooks, typically in pdf/work/")
+    args = parser.parse_args()
+
+    to_convert = []
+    for notebook in args.notebooks:
+        if args.force or needs_conversion(notebook):
+            to_convert.append(notebook)
+        else:
+            print(f"{Path(notebook).with_suffix('.tex')} OK")
+
+    failed = []
+    def collect(results):
+        for notebook, elapsed, error in results:
+            if error:
+                print(f"failure with {notebook}: {error}")
+                failed.append(notebook)
+            elif args.verbose:
+                print(f"{Path(notebook).with_suffix('.tex')} converted in {elapsed:.2f}s")
+
+    if args.jobs <= 1:
+        collect(map(convert_notebook, to_convert))
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            collect(executor.map(convert_notebook, to_convert))
+
+    if failed:
+        print(f"{len(failed)} notebook(s) failed to convert")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -1,20 +1,30 @@
 #!/usr/bin/env python3
 
+import sys
 from pathlib import Path
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
+# n'écrire que si ça change quelque chose, pour que les fichiers
+# inchangés gardent leur date et ne provoquent pas de recompilation
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tools"))
+from util import write_if_changed                   # pylint: disable=c0413
+
 
 # comme on ne peut plus ranger les titres de chapitre dans Python.tex
-# on les met dans un fichier à part
+# on les met dans un fichier à part, qu'on lit une bonne fois
 
-def read_title(target_week):
-    with open("ChapterNames.txt") as feed:
+def read_titles(filename="ChapterNames.txt"):
+    titles = {}
+    with open(filename) as feed:
         for line in feed:
             week, title = line.split(':')
-            iweek = week.strip()
-            if iweek == target_week:
-                return title.strip()
-    return f"Titre pas trouvé pour semaine {target_week}"
+            titles[week.strip()] = title.strip()
+    return titles
+
+
+def read_title(target_week, titles):
+    return titles.get(str(target_week),
+                      f"Titre pas trouvé pour semaine {target_week}")
 
 
 # on retrouve les noms des notebooks appartenant à une semaine
@@ -26,24 +36,88 @@ def notebook_names(target_week, workdir):
         yield nbpath.stem
 
 
-# créer le fichier .tex qui contient ce qu'on veut montrer
-def write_output(weekrange, first_chapter, outputname, workdir):
-    with open(outputname, "w") as output:
-        for index, week in enumerate(weekrange):
-            title = read_title(week)
+# un fichier par chapitre, qui ne dépend que de la semaine
+# et de la liste de ses notebooks; on l'inclut avec \include
+# ce qui permet de se servir de \includeonly
+def chapter_name(week):
+    return f"chapter-w{week}"
 
-            # index == 0 correspond au premier chapitre dans le .tex
-            if index == 0:
-                # ajouter le numéro du chapitre = numéro de semaine
-                output.write(rf"\setcounter{{chapter}}{{{int(first_chapter)-1}}}" "\n")
-            output.write("\n" rf"\chapter{{{title}}}" "\n")
-            if index == 0:
-                output.write(r"\pagestyle{moocpagestyle}" "\n")
-                output.write(r"\setcounter{page}{1}" "\n")
 
-            # les notebooks du chapitre
-            for notebook in notebook_names(week, workdir):
-                output.write(rf"\input{{{notebook}}}" "\n")
+def write_chapter(week, title, notebooks, workdir):
+    """
+    returns True if the chapter file was (re)written
+    """
+    lines = [rf"\chapter{{{title}}}",
+             # défini dans contents.tex, seul le 1er chapitre
+             # du périmètre remet le numéro de page à 1
+             r"\moocchapterstart"]
+    lines += [rf"\input{{{notebook}}}" for notebook in notebooks]
+    path = Path(workdir) / f"{chapter_name(week)}.tex"
+    return write_if_changed(path, "\n".join(lines) + "\n")
+
+
+# créer le fichier .tex qui contient ce qu'on veut montrer
+# retourne un dict  semaine -> liste des notebooks du chapitre
+def write_output(weekrange, first_chapter, outputname, workdir, titles):
+    chapters = {}
+    # ajouter le numéro du chapitre = numéro de semaine
+    lines = [rf"\setcounter{{chapter}}{{{int(first_chapter)-1}}}",
+             # juste après le titre de chaque chapitre; on teste le numéro
+             # plutôt que de le faire la 1ère fois, car avec --include-only
+             # le 1er chapitre exécuté n'est pas forcément le 1er du périmètre
+             rf"\def\moocfirstchapter{{{int(first_chapter)}}}",
+             r"\gdef\moocchapterstart{\pagestyle{moocpagestyle}"
+             r"\ifnum\value{chapter}=\moocfirstchapter\relax"
+             r"\setcounter{page}{1}\fi}"]
+    for week in weekrange:
+        notebooks = list(notebook_names(week, workdir))
+        chapters[week] = notebooks
+        if write_chapter(week, read_title(week, titles), notebooks, workdir):
+            print(f"{chapter_name(week)}.tex (re)written")
+        lines.append(rf"\include{{{chapter_name(week)}}}")
+    write_if_changed(Path(outputname), "\n".join(lines) + "\n")
+    return chapters
+
+
+# à la Makefile: de quels w<i>-s*.tex dépend chaque chapitre
+def write_depfile(chapters, outputname):
+    outputpath = Path(outputname)
+    lines = ["# generated by scopecontents.py"]
+    for week, notebooks in chapters.items():
+        name = chapter_name(week)
+        deps = " ".join(f"{notebook}.tex" for notebook in notebooks)
+        lines.append(f"{name}.aux: {name}.tex {deps}".rstrip())
+    auxes = " ".join(f"{chapter_name(week)}.aux" for week in chapters)
+    lines.append(f"Python.pdf: Python.tex {outputpath.name} {auxes}")
+    depfile = outputpath.with_suffix('.d')
+    write_if_changed(depfile, "\n".join(lines) + "\n")
+
+
+# \includeonly doit être dans le préambule, qui fait un
+# \InputIfFileExists{includeonly}; pas de fichier = tout inclure
+def write_includeonly(weeks, workdir):
+    path = Path(workdir) / "includeonly.tex"
+    if not weeks:
+        path.unlink(missing_ok=True)
+        return
+    names = ",".join(chapter_name(week) for week in weeks)
+    write_if_changed(path, rf"\includeonly{{{names}}}" "\n")
+
+
+# est-ce que le pdf est plus récent que tout ce dont il dépend ?
+# contents.tex n'en fait pas partie car il est partagé
+# entre les différents pdfs
+def up_to_date(pdf, chapters, workdir):
+    pdfpath = Path(pdf)
+    if not pdfpath.exists():
+        return False
+    workpath = Path(workdir)
+    deps = [workpath / "Python.tex"]
+    for week, notebooks in chapters.items():
+        deps.append(workpath / f"{chapter_name(week)}.tex")
+        deps += [workpath / f"{notebook}.tex" for notebook in notebooks]
+    pdf_mtime = pdfpath.stat().st_mtime
+    return all(dep.stat().st_mtime <= pdf_mtime for dep in deps if dep.exists())
 
 
 # ya plus qu'à
@@ -54,9 +128,17 @@ def main():
     parser.add_argument('-t', '--to', dest='w_to', type=int, default=9,
                         help='last week')
     parser.add_argument('-o', '--output', default="work/contents.tex",
-                        help='output tex')
+                        help='output tex; the dependencies go in the .d next to it')
     parser.add_argument('-w', '--work-dir',
                         dest='workdir', default="work")
+    parser.add_argument('-i', '--include-only', dest='include_only',
+                        action='append', default=[], metavar='WEEK',
+                        help='only typeset these weeks - can be repeated;'
+                             ' the other chapters keep their numbering from a previous run')
+    parser.add_argument('-u', '--up-to-date', dest='up_to_date', default=None,
+                        metavar='PDF',
+                        help='exit with 0 if that pdf is more recent than its dependencies,'
+                             ' and with 1 otherwise')
     parser.add_argument("weeks", nargs='*')
 
     args = parser.parse_args()
@@ -70,8 +152,15 @@ def main():
         weekrange = [str(w) for w in range(args.w_from, args.w_to+1)]
         first_chapter = args.w_from
 
-    write_output(weekrange, first_chapter, args.output, args.workdir)
+    titles = read_titles()
+    chapters = write_output(weekrange, first_chapter, args.output, args.workdir, titles)
+    write_depfile(chapters, args.output)
+    write_includeonly(args.include_only, args.workdir)
+
+    if args.up_to_date:
+        return 0 if up_to_date(args.up_to_date, chapters, args.workdir) else 1
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    exit(main())
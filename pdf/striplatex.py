@@ -2,6 +2,9 @@
 
 import sys
 import re
+from pathlib import Path
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 from argparse import (ArgumentParser, ArgumentDefaultsHelpFormatter)
 
 # this is where we put boxes around code cells
@@ -42,6 +45,69 @@ replacements = [
      '\n\\\\end{Verbatim}'),
  ]
 
+def compile_replacements(replacements):
+    """
+    turns the replacements table into a list of functions
+    that each take a string and return the modified string
+    """
+    compiled = []
+    for mode, before, after in replacements:
+        if mode == 'plain':
+            compiled.append(
+                lambda text, before=before, after=after: text.replace(before, after))
+        elif mode == 'regex':
+            compiled.append(partial(re.compile(before).sub, after))
+        else:
+            print(f'Unknown mode {mode} in replacements')
+    return compiled
+
+REPLACEMENTS = compile_replacements(replacements)
+
+# what strip_latex leaves behind, so we can tell it has already been done
+DONE_MARKER = r'%%%\begin{document}'
+
+NBNAME_PATTERN = re.compile(r'w(?P<week>[0-9]+)-s(?P<seq>[0-9]+)')
+
+
+class Stripper:
+    """
+    applies the replacements on a stream of lines, and writes
+    the result as it goes, by blocks of about BLOCK characters
+
+    the only replacement that spans several lines is about removing the
+    whitespace before \end{Verbatim}; so the trailing whitespace of each
+    block is held back and prepended to the next one
+    """
+    BLOCK = 64 * 1024
+
+    def __init__(self, out_file):
+        self.out_file = out_file
+        self.pending = ""
+        self.lines = []
+        self.size = 0
+
+    def write(self, line):
+        self.lines.append(line)
+        self.size += len(line)
+        if self.size >= self.BLOCK:
+            self.flush()
+
+    def flush(self):
+        text = self.pending + "".join(self.lines)
+        self.lines, self.size = [], 0
+        for replacement in REPLACEMENTS:
+            text = replacement(text)
+        # same as the whitespace matched by \s in the regexps
+        cut = len(text.rstrip())
+        self.out_file.write(text[:cut])
+        self.pending = text[cut:]
+
+    def close(self):
+        self.flush()
+        self.out_file.write(self.pending)
+        self.pending = ""
+
+
 def strip_latex(in_file, out_file, nbname):
     """
     Read from a file object, save in a file object
@@ -49,25 +115,25 @@ def strip_latex(in_file, out_file, nbname):
     Removes header and footer; adds a mention of the notebook name
     after the first section
 
-    Idempotent
+    Idempotent; works in a single pass over the input
     """
     ignoring = True
-    buffer = ""
+    stripper = Stripper(out_file)
 
-    pattern = re.compile(r'w(?P<week>[0-9]+)-s(?P<seq>[0-9]+)')
-    week, seq = pattern.match(nbname).groups()
+    week, seq = NBNAME_PATTERN.match(nbname).groups()
 
-    for line in in_file:
+    lines = iter(in_file)
+    for line in lines:
         if r'\begin{document}' in line:
             ignoring = False
             # define name only if we run this for the first time
             if '%%%' not in line:
-                buffer += rf"\renewcommand{{\notebookname}}{{{nbname}}}" + "\n"
-                buffer += rf"\renewcommand{{\notebookweek}}{{{week}}}" + "\n"
-                buffer += rf"\renewcommand{{\notebookseq}}{{{seq}}}" + "\n"
+                stripper.write(rf"\renewcommand{{\notebookname}}{{{nbname}}}" + "\n")
+                stripper.write(rf"\renewcommand{{\notebookweek}}{{{week}}}" + "\n")
+                stripper.write(rf"\renewcommand{{\notebookseq}}{{{seq}}}" + "\n")
             # for idempotency, i.e. so that we can run this
             # several times with no further changes
-            buffer += r'%%%\begin{document}' + '\n'
+            stripper.write(DONE_MARKER + '\n')
             continue
         if r'\end{document}' in line:
             ignoring = True
@@ -84,30 +150,88 @@ def strip_latex(in_file, out_file, nbname):
             closing = line.count('}')
             # hopefully one more line is enough in this case
             if opening > closing:
-                next(in_file)
+                next(lines)
             continue
         if not ignoring:
-            buffer += line
+            stripper.write(line)
 
-    # apply replacements
-    for mode, before, after in replacements:
-        if mode == 'plain':
-            buffer = buffer.replace(before, after)
-        elif mode == 'regex':
-            buffer = re.compile(before).sub(after, buffer)
-        else:
-            print(f'Unknown mode {mode} in replacements')
+    stripper.close()
+
+
+def already_stripped(path):
+    with path.open() as in_file:
+        return any(DONE_MARKER in line for line in in_file)
 
-    out_file.write(buffer)
+
+def strip_file(path):
+    """
+    strip one .tex file in place, unless it has already been done
+
+    returns a tuple (path, status) where status is
+    'stripped', 'skipped', or an error message
+    """
+    tmp = path.with_name(path.name + '.tmp')
+    try:
+        if already_stripped(path):
+            return path, 'skipped'
+        with path.open() as in_file, tmp.open('w') as out_file:
+            strip_latex(in_file, out_file, path.stem)
+        tmp.replace(path)
+        return path, 'stripped'
+    except Exception as exc:
+        tmp.unlink(missing_ok=True)
+        return path, f"{type(exc).__name__}: {exc}"
+
+
+def tex_files(paths):
+    """
+    the .tex files in paths; a directory stands for all the
+    notebook-like .tex files in there, e.g. w1-s2-c3-some-name.tex
+    """
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from sorted(tex for tex in path.glob('*.tex')
+                              if NBNAME_PATTERN.match(tex.stem))
+        else:
+            yield path
 
 
 def main():
-    parser = ArgumentParser(usage="redirect stdin and stdout as appropriate")
-    parser.add_argument('-n', "--name", default='striplatex-name')
+    parser = ArgumentParser(
+        usage="redirect stdin and stdout as appropriate,"
+              " or pass .tex files or directories to work in place",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-n', "--name", default='striplatex-name',
+                        help="the notebook name, in filter mode")
+    parser.add_argument('-j', "--jobs", type=int, default=1,
+                        help="in batch mode, strip that many files in parallel")
+    parser.add_argument('-v', "--verbose", action='store_true', default=False)
+    parser.add_argument("paths", nargs='*',
+                        help="batch mode: .tex files, or directories like work/")
     args = parser.parse_args()
 
-    strip_latex(sys.stdin, sys.stdout, args.name)
+    if not args.paths:
+        strip_latex(sys.stdin, sys.stdout, args.name)
+        return 0
+
+    paths = list(tex_files(args.paths))
+    if args.jobs <= 1:
+        results = list(map(strip_file, paths))
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            results = list(executor.map(strip_file, paths))
+    failures = 0
+    for path, status in results:
+        if status not in ('stripped', 'skipped'):
+            print(f"failure with {path}: {status}")
+            failures += 1
+        elif args.verbose:
+            print(f"{path}: {status}")
+    counts = {status: sum(result == status for _, result in results)
+              for status in ('stripped', 'skipped')}
+    print(f"{counts['stripped']} file(s) stripped, {counts['skipped']} skipped,"
+          f" {failures} failed")
+    return 1 if failures else 0
 
 if __name__ == '__main__':
-    main()
-    exit(0)
+    exit(main())
@@ -0,0 +1,63 @@
+"""
+run with pytest from the pdf/ directory
+"""
+
+import sys
+import importlib
+
+import nbformat
+
+from nbcustomexec import (ExecCache, load_notebook, execute_notebook,
+                          output_size, CELL_MAX_OUTPUT)
+
+
+def test_inputs_key_ignores_bytecode(tmp_path):
+    exec_dir = tmp_path / "exec"
+    corrections = exec_dir / "modules" / "corrections"
+    corrections.mkdir(parents=True)
+    (corrections / "__init__.py").write_text("")
+    (corrections / "exo_one.py").write_text("def one():\n    return 1\n")
+    notebook_path = tmp_path / "nb.py"
+    notebook_path.write_text("# %%\nfrom corrections.exo_one import one\none()\n")
+    notebook = load_notebook(notebook_path)
+
+    def key():
+        # a fresh cache object, like in another run
+        return ExecCache(tmp_path / "cache", exec_dir,
+                         ["modules/corrections"]).key(notebook)
+
+    first = key()
+    # what a kernel does when the notebook runs
+    sys.path.insert(0, str(exec_dir / "modules"))
+    dont_write_bytecode, sys.dont_write_bytecode = sys.dont_write_bytecode, False
+    try:
+        importlib.import_module("corrections.exo_one")
+    finally:
+        sys.dont_write_bytecode = dont_write_bytecode
+        sys.path.remove(str(exec_dir / "modules"))
+        for name in ("corrections.exo_one", "corrections"):
+            sys.modules.pop(name, None)
+    assert list(corrections.glob("__pycache__/*.pyc"))
+    (corrections / ".exo_one.py.swp").write_text("editor junk")
+    assert key() == first
+    # whereas a real change is seen
+    (corrections / "exo_one.py").write_text("def one():\n    return 2\n")
+    assert key() != first
+
+
+def test_max_output_after_wrapping(tmp_path):
+    # long lines get wrapped after execution, which adds bytes
+    budget = 500
+    notebook_path = tmp_path / "long.ipynb"
+    cell = nbformat.v4.new_code_cell("for i in range(20):\n    print(str(i) * 200)")
+    cell.metadata[CELL_MAX_OUTPUT] = budget
+    nbformat.write(nbformat.v4.new_notebook(cells=[cell]), str(notebook_path))
+    output_path = tmp_path / "out"
+    output_path.mkdir()
+    report = execute_notebook(notebook_path, str(tmp_path), output_path,
+                              verbose=False)
+    assert [violation['budget'] for violation in report['violations']] == ['output']
+    executed = nbformat.read(str(output_path / "long.ipynb"), as_version=4)
+    outputs = executed.cells[0].outputs
+    assert "truncated" in outputs[-1].text
+    assert sum(output_size(output) for output in outputs) <= budget
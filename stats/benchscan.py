@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""
+time scan.py on synthetic sessions of growing sizes
+
+each scan runs in its own process, so that its peak memory can be measured;
+the synthetic sessions are kept in the work dir and reused from one run
+to the next, as generating the big ones takes a while
+"""
+
+import os
+import sys
+import time
+import shutil
+import subprocess
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from synthetic import generate
+
+SCAN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scan.py")
+
+
+def session(workdir, students, seed):
+    """
+    the path to a synthetic session with that many students,
+    created if needed; returns a tuple (path, number of lines)
+    """
+    path = os.path.join(workdir, "session-{}".format(students))
+    marker = os.path.join(path, ".lines")
+    if os.path.exists(marker):
+        with open(marker) as feed:
+            return path, int(feed.read())
+    shutil.rmtree(path, ignore_errors=True)
+    print("generating {} students in {}".format(students, path), file=sys.stderr)
+    lines = generate(path, students, seed=seed)
+    with open(marker, 'w') as output:
+        output.write(str(lines))
+    return path, lines
+
+
+def run_scan(options):
+    """
+    run scan.py with these options
+
+    returns a tuple (elapsed seconds, peak memory in MiB)
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, SCAN] + options,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # wait4 gives us the resource usage of that process only
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if status != 0:
+        raise RuntimeError("scan.py {} failed".format(" ".join(options)))
+    # ru_maxrss is in KiB on linux
+    return elapsed, usage.ru_maxrss / 1024
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-s", "--scales", type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help="numbers of students")
+    parser.add_argument("-j", "--jobs", type=int, nargs='+', default=[1, 4],
+                        help="values of scan.py --jobs to try")
+    parser.add_argument("-i", "--incremental", action='store_true', default=False,
+                        help="also time a scan.py --incremental with nothing new")
+    parser.add_argument("-w", "--workdir", default="/tmp/benchscan")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    print("{:>8} {:>9} {:>13} {:>8} {:>12} {:>9}".format(
+        "students", "lines", "mode", "seconds", "lines/s", "peak MiB"))
+    for students in args.scales:
+        path, lines = session(args.workdir, students, args.seed)
+        runs = [("-j {}".format(jobs), ["-j", str(jobs), path]) for jobs in args.jobs]
+        if args.incremental:
+            state = os.path.join(args.workdir, "state-{}.json".format(students))
+            # a first run to fill the state, not measured
+            run_scan(["-i", state, path])
+            runs.append(("incremental", ["-i", state, path]))
+        for mode, options in runs:
+            elapsed, peak = run_scan(options)
+            print("{:>8} {:>9} {:>13} {:>8.2f} {:>12.0f} {:>9.1f}".format(
+                students, lines, mode, elapsed, lines / elapsed, peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -16,3 +16,7 @@ mv -f students ${date}
 
 
 
+
+# during a live session, refresh the stats with e.g.
+# ./scan.py --incremental live.state ${date}
+# that only reads what has been appended since the previous run
@@ -2,14 +2,26 @@
 
 from __future__ import print_function
 
+import io
 import sys
 import os.path
+import csv
+import json
+import hashlib
 import traceback
 
 from glob import glob
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 from argparse import ArgumentParser
 
+# works both as stats.scan, and as a script run from anywhere
+try:
+    from .store import AttemptStore
+except ImportError:
+    from store import AttemptStore
+
 class Attempts:
     def __init__(self):
         self.ok = 0
@@ -19,66 +31,443 @@ class Attempts:
             self.ok += 1
         else:
             self.ko += 1
+    def merge(self, other):
+        self.ok += other.ok
+        self.ko += other.ko
+        return self
     def __repr__(self):
         return "{} ok + {} ko = {}".format(self.ok, self.ko, self.ok + self.ko)
 
-def scan (dirname):
+
+def scan_log(log, subdir, total_attempts, attempts_by_exo, store=None):
+    """
+    stream the lines of one .correction file into the counters,
+    and into the attempts store if provided
+    """
+    student = os.path.basename(subdir)
+    for line in log:
+        try:
+            date, id1, id2, function, result = line.split()
+        except ValueError:
+            print('skipping line=', line, '\tin subdir', subdir, file=sys.stderr)
+            continue
+        total_attempts.record(result)
+        attempts = attempts_by_exo.get(function)
+        if attempts is None:
+            attempts = attempts_by_exo[function] = Attempts()
+        attempts.record(result)
+        if store is not None:
+            store.append(student, date, id1, id2, function, result)
+
+
+def scan_shard(subdirs, with_store=False):
+    """
+    scan a range of student subdirs; this is what runs in each worker
+
+    returns a tuple nb_dirs, nb_students, total_attempts, attempts_by_exo, store
+    where store is None unless with_store is set
+    """
     nb_dirs = 0
     nb_students = 0
     total_attempts = Attempts()
     attempts_by_exo = {}
+    store = AttemptStore() if with_store else None
 
-    subdirs = glob(os.path.join(dirname,"*"))
     for subdir in subdirs:
         nb_dirs += 1
         try:
             with open(os.path.join(subdir,".correction")) as log:
                 nb_students += 1
-                for lineno, line in enumerate(log):
-                    try:
-                        date, id1, id2, function, result = line.split()
-                        total_attempts.record(result)
-                        attempts_by_exo.setdefault(function, Attempts())
-                        attempts_by_exo[function].record(result)
-                    except:
-                        print('skipping line=', line, '\tin subdir', subdir, file=sys.stderr)
-                        pass
+                scan_log(log, subdir, total_attempts, attempts_by_exo, store)
         except:
             traceback.print_exc()
             pass
 
-    print("{nb_students} students have tried at least once".format(**locals()))
-    if nb_dirs != nb_students:
-        print("{nb_dirs} dirs were found (should be {nb-students})".format(**locals()))
-
-    ok = total_attempts.ok
-    ko = total_attempts.ko
-    total = ok + ko
-    exos = len(attempts_by_exo)
-    trials_per_student = total / float(nb_students)
-    ratio = float(ok)/total
-    print("""  {ok} ok (successful) trials
+    return nb_dirs, nb_students, total_attempts, attempts_by_exo, store
+
+
+def shards(subdirs, nb_shards):
+    """
+    cut the sorted list of subdirs into nb_shards contiguous ranges
+    """
+    size = max(1, -(-len(subdirs) // nb_shards))
+    return [subdirs[i:i+size] for i in range(0, len(subdirs), size)]
+
+
+def merge_shards(results):
+    nb_dirs = 0
+    nb_students = 0
+    total_attempts = Attempts()
+    attempts_by_exo = {}
+    store = None
+    for shard_dirs, shard_students, shard_total, shard_by_exo, shard_store in results:
+        if shard_store is not None:
+            store = shard_store if store is None else store.extend(shard_store)
+        nb_dirs += shard_dirs
+        nb_students += shard_students
+        total_attempts.merge(shard_total)
+        for function, attempts in shard_by_exo.items():
+            attempts_by_exo.setdefault(function, Attempts()).merge(attempts)
+    return nb_dirs, nb_students, total_attempts, attempts_by_exo, store
+
+
+# a few shards per worker, so that a slow range does not hold the others up
+SHARDS_PER_JOB = 4
+
+def run_shards(function, subdirs, jobs):
+    """
+    run function on subdirs, in one go or spread over a process pool
+    """
+    if jobs <= 1:
+        return [function(subdirs)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(function, shards(subdirs, jobs * SHARDS_PER_JOB)))
+
+
+class ScanResult:
+    """
+    what was found in one session directory
+
+    for compatibility it can still be unpacked like the tuple
+    that scan() used to return:
+    nb_dirs, nb_students, total_attempts, attempts_by_exo = scan(dirname)
+    """
+    def __init__(self, dirname, nb_dirs, nb_students, total_attempts, attempts_by_exo):
+        self.dirname = dirname
+        self.nb_dirs = nb_dirs
+        self.nb_students = nb_students
+        self.total_attempts = total_attempts
+        self.attempts_by_exo = attempts_by_exo
+
+    def __iter__(self):
+        return iter((self.nb_dirs, self.nb_students,
+                     self.total_attempts, self.attempts_by_exo))
+
+    def as_dict(self):
+        return dict(dirname=self.dirname, nb_dirs=self.nb_dirs,
+                    nb_students=self.nb_students,
+                    ok=self.total_attempts.ok, ko=self.total_attempts.ko,
+                    by_exo={function: dict(ok=attempts.ok, ko=attempts.ko)
+                            for function, attempts in sorted(self.attempts_by_exo.items())})
+
+    CSV_COLUMNS = ['dirname', 'function', 'ok', 'ko', 'total']
+
+    def csv_rows(self):
+        """
+        one row per function, and one with function='*' for the totals
+        """
+        attempts_by_exo = [('*', self.total_attempts)] + sorted(self.attempts_by_exo.items())
+        for function, attempts in attempts_by_exo:
+            yield dict(dirname=self.dirname, function=function, ok=attempts.ok,
+                       ko=attempts.ko, total=attempts.ok + attempts.ko)
+
+    def print_text(self):
+        nb_dirs = self.nb_dirs
+        nb_students = self.nb_students
+        print("{nb_students} students have tried at least once".format(**locals()))
+        if nb_dirs != nb_students:
+            print("{nb_dirs} dirs were found (should be {nb_students})".format(**locals()))
+
+        ok = self.total_attempts.ok
+        ko = self.total_attempts.ko
+        total = ok + ko
+        exos = len(self.attempts_by_exo)
+        trials_per_student = total / float(max(nb_students, 1))
+        ratio = float(ok)/max(total, 1)
+        print("""  {ok} ok (successful) trials
 + {ko} ko (unsuccessful) trials
 = {total} total trials ({ratio}% success)
 
 {exos} different exercices -> an average of {trials_per_student} attempts per student"""\
-    .format(**locals()))
+        .format(**locals()))
+
+
+        for function in sorted(self.attempts_by_exo):
+            print (function, self.attempts_by_exo[function])
+        print()
+
+
+def student_subdirs(dirname):
+    return sorted(glob(os.path.join(dirname,"*")))
+
+
+def scan (dirname, jobs=1, store_filename=None):
+    """
+    scan a session directory, and return a ScanResult
+
+    if store_filename is provided, all attempts are also saved
+    in that file as an AttemptStore - see store.py
+    """
+    subdirs = student_subdirs(dirname)
+    with_store = store_filename is not None
+    results = run_shards(partial(scan_shard, with_store=with_store), subdirs, jobs)
+    nb_dirs, nb_students, total_attempts, attempts_by_exo, store = merge_shards(results)
+    if store is not None:
+        store.save(store_filename)
+    return ScanResult(dirname, nb_dirs, nb_students, total_attempts, attempts_by_exo)
+
+
+def scan_many(dirnames, jobs=1):
+    """
+    scan several session directories, and return a list of ScanResult
 
+    the shards of all sessions are queued at once on a single pool
+    """
+    if jobs <= 1:
+        return [scan(dirname) for dirname in dirnames]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = [(dirname, [executor.submit(scan_shard, shard)
+                              for shard in shards(student_subdirs(dirname),
+                                                  jobs * SHARDS_PER_JOB)])
+                   for dirname in dirnames]
+        return [ScanResult(dirname,
+                           *merge_shards(future.result() for future in futures)[:4])
+                for dirname, futures in pending]
 
-    for function in sorted(attempts_by_exo):
-        print (function, attempts_by_exo[function])
-    print()
 
-    return nb_dirs, nb_students, total_attempts, attempts_by_exo
+####################
+# incremental mode: a state file remembers, for each student, how far
+# its .correction file has been read, as well as the aggregates so far;
+# the next run only reads what has been appended since then
+#
+# students are identified by the name of their subdir, so that the
+# same state can be used on the successive dirs created by pull.sh;
+# as extracting a tarball creates new files, and thus new inodes,
+# a file whose inode has changed is still deemed to have grown if its
+# contents right before the known offset are unchanged
+
+# how many bytes before the offset are used to check that
+FINGERPRINT_SIZE = 256
+
+STATE_VERSION = 1
+
+
+def fingerprint(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def new_state():
+    # store is None, or the path and number of rows of the store
+    # that holds exactly the attempts accounted for in this state
+    return dict(version=STATE_VERSION, students={}, ok=0, ko=0, by_exo={},
+                store=None)
+
+
+def load_matching_store(state, store_filename):
+    """
+    the store that goes with state, or None if there is no such store on disk;
+    this happens e.g. when the previous runs were done without --store
+    """
+    if not state['students']:
+        return AttemptStore()
+    expected = state.get('store')
+    if expected is None or expected['path'] != os.path.abspath(store_filename):
+        return None
+    try:
+        store = AttemptStore.load(store_filename)
+    except (OSError, ValueError):
+        return None
+    return store if len(store) == expected['rows'] else None
+
+
+def load_state(filename):
+    try:
+        with open(filename) as feed:
+            state = json.load(feed)
+        if state.get('version') == STATE_VERSION:
+            return state
+    except (OSError, ValueError):
+        pass
+    return new_state()
+
+
+def save_state(filename, state):
+    "atomically, so that an interrupted run leaves the previous state"
+    tmp = "{}.{}.tmp".format(filename, os.getpid())
+    with open(tmp, 'w') as output:
+        json.dump(state, output)
+    os.replace(tmp, filename)
+
+
+def tail_correction(subdir, known):
+    """
+    read what was appended to the .correction in subdir since we last saw it
+
+    known is the state entry for that student, or None
+
+    returns a tuple (status, entry, lines) where status is
+    * None if there is no .correction - or subdir is not even a directory,
+    * 'rewritten' if the file does not extend what we have already read,
+    * 'read' otherwise
+    """
+    path = os.path.join(subdir, ".correction")
+    try:
+        with open(path, 'rb') as log:
+            stat = os.fstat(log.fileno())
+            offset = 0
+            if known is not None:
+                if stat.st_size < known['offset']:
+                    return 'rewritten', None, []
+                if stat.st_ino != known['inode']:
+                    start = max(0, known['offset'] - FINGERPRINT_SIZE)
+                    log.seek(start)
+                    if fingerprint(log.read(known['offset'] - start)) != known['fingerprint']:
+                        return 'rewritten', None, []
+                offset = known['offset']
+            log.seek(max(0, offset - FINGERPRINT_SIZE))
+            data = log.read()
+    except OSError:
+        # like in scan_shard, but quietly as this is expected
+        # for the students that have not tried anything yet
+        return None, None, []
+    before = offset - max(0, offset - FINGERPRINT_SIZE)
+    # leave an incomplete last line for next time
+    end = data.rfind(b"\n") + 1
+    end = max(end, before)
+    new_offset = offset + end - before
+    entry = dict(inode=stat.st_ino, offset=new_offset,
+                 fingerprint=fingerprint(data[max(0, end - FINGERPRINT_SIZE):end]))
+    # not splitlines(), that also breaks on e.g. \x0b or \u2028; this splits
+    # and translates newlines like a file opened in text mode does
+    lines = list(io.StringIO(data[before:end].decode(errors='replace'), newline=None))
+    return 'read', entry, lines
+
+
+def tail_shard(items, with_store=False):
+    """
+    items is a list of tuples (subdir, known state entry or None)
+
+    returns a tuple (nb_dirs, entries, total_attempts, attempts_by_exo, store, rewritten)
+    with entries a dict student -> new state entry, and
+    rewritten the list of subdirs whose file was not just appended to
+    """
+    nb_dirs = 0
+    entries = {}
+    total_attempts = Attempts()
+    attempts_by_exo = {}
+    store = AttemptStore() if with_store else None
+    rewritten = []
+    for subdir, known in items:
+        nb_dirs += 1
+        status, entry, lines = tail_correction(subdir, known)
+        if status == 'rewritten':
+            rewritten.append(subdir)
+        elif status == 'read':
+            entries[os.path.basename(subdir)] = entry
+            scan_log(lines, subdir, total_attempts, attempts_by_exo, store)
+    return nb_dirs, entries, total_attempts, attempts_by_exo, store, rewritten
+
+
+def scan_incremental(dirname, state_filename, jobs=1, store_filename=None):
+    """
+    like scan(), but only reads what is new since the last run with that state;
+    if some file turns out to have been rewritten, everything is read again
+    """
+    state = load_state(state_filename)
+    subdirs = student_subdirs(dirname)
+    with_store = store_filename is not None
+    store = None
+    if with_store:
+        store = load_matching_store(state, store_filename)
+        if store is None:
+            print("store {} is not in line with state {} - starting from scratch"
+                  .format(store_filename, state_filename), file=sys.stderr)
+            state = new_state()
+            store = AttemptStore()
+    # a second round is needed only if some file has been rewritten
+    for _ in range(2):
+        items = [(subdir, state['students'].get(os.path.basename(subdir)))
+                 for subdir in subdirs]
+        results = run_shards(partial(tail_shard, with_store=with_store), items, jobs)
+        if not any(result[-1] for result in results):
+            break
+        for result in results:
+            for subdir in result[-1]:
+                print("{} has been rewritten - starting from scratch".format(subdir),
+                      file=sys.stderr)
+        state = new_state()
+        if with_store:
+            store = AttemptStore()
+
+    nb_dirs = 0
+    total_attempts = Attempts()
+    total_attempts.ok, total_attempts.ko = state['ok'], state['ko']
+    attempts_by_exo = {}
+    for function, (ok, ko) in state['by_exo'].items():
+        attempts = attempts_by_exo[function] = Attempts()
+        attempts.ok, attempts.ko = ok, ko
+    new_lines = 0
+    for shard_dirs, entries, shard_total, shard_by_exo, shard_store, _ in results:
+        nb_dirs += shard_dirs
+        state['students'].update(entries)
+        new_lines += shard_total.ok + shard_total.ko
+        total_attempts.merge(shard_total)
+        for function, attempts in shard_by_exo.items():
+            attempts_by_exo.setdefault(function, Attempts()).merge(attempts)
+        if shard_store is not None:
+            store.extend(shard_store)
+    nb_students = len(state['students'])
+
+    state['ok'], state['ko'] = total_attempts.ok, total_attempts.ko
+    state['by_exo'] = {function: [attempts.ok, attempts.ko]
+                       for function, attempts in attempts_by_exo.items()}
+    if store is not None:
+        store.save(store_filename)
+        state['store'] = dict(path=os.path.abspath(store_filename), rows=len(store))
+    else:
+        # the attempts read in this run will never make it to any store
+        state['store'] = None
+    save_state(state_filename, state)
+
+    print("{} new attempts since last run".format(new_lines), file=sys.stderr)
+    return ScanResult(dirname, nb_dirs, nb_students, total_attempts, attempts_by_exo)
         
 
 
 
-parser = ArgumentParser()
-parser.add_argument ("dirname")
-args = parser.parse_args()
+def output(results, format):
+    if format == 'json':
+        json.dump([result.as_dict() for result in results], sys.stdout, indent=1)
+        print()
+    elif format == 'csv':
+        writer = csv.DictWriter(sys.stdout, fieldnames=ScanResult.CSV_COLUMNS)
+        writer.writeheader()
+        for result in results:
+            writer.writerows(result.csv_rows())
+    else:
+        for result in results:
+            if len(results) > 1:
+                print("==================== {}".format(result.dirname))
+            result.print_text()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument ("-j", "--jobs", type=int, default=1,
+                         help="spread the student subdirs over that many processes")
+    parser.add_argument ("-s", "--store", default=None,
+                         help="also save all attempts in that file, to be queried with store.py")
+    parser.add_argument ("-i", "--incremental", default=None, metavar="STATE",
+                         help="only read what is new since the last run with that state file")
+    parser.add_argument ("-f", "--format", choices=("text", "json", "csv"), default="text")
+    parser.add_argument ("dirnames", nargs='+', metavar="dirname",
+                         help="several sessions can be scanned at once, on a single pool")
+    args = parser.parse_args()
+
+    if len(args.dirnames) > 1:
+        if args.store or args.incremental:
+            parser.error("--store and --incremental work on a single dirname")
+        results = scan_many(args.dirnames, args.jobs)
+    elif args.incremental:
+        results = [scan_incremental(args.dirnames[0], args.incremental,
+                                    args.jobs, args.store)]
+    else:
+        results = [scan(args.dirnames[0], args.jobs, args.store)]
+    output(results, args.format)
+
 
-scanned = scan (args.dirname)
+if __name__ == '__main__':
+    main()
 
 # NOTE for session 2
 # student b8766b1632296f06a22f501f21d8a352 needs to be discarded
@@ -1,5 +1,7 @@
 #!/bin/bash
 
+# set SCANJOBS to change the number of processes used by scan.py
+
 if [[ -n "$@" ]]; then
     toscan="$@"
 else
@@ -9,5 +11,5 @@ fi
 for dir in $toscan; do
     [ -d $dir ] || { echo $dir not a directory - skipped; continue; }
     echo Scanning $dir
-    ./scan.py $dir > $dir.scan
+    ./scan.py --jobs ${SCANJOBS:-4} $dir > $dir.scan
 done
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""
+a compact, columnar store for all the attempts found in .correction files
+
+each attempt is one row; strings - student, id1, id2, function - are
+interned in a single table, so that columns are plain arrays of integers;
+the store can be saved in a binary file, and reloaded to answer questions
+without scanning the student directories again
+
+numpy is not needed; columns are stdlib arrays, and queries are single passes
+"""
+
+import sys
+import json
+from array import array
+from functools import lru_cache
+from datetime import datetime, timezone
+
+from argparse import ArgumentParser
+
+# in the rows, for dates that could not be understood
+NO_TIME = -1
+
+DAY = 24 * 3600
+
+MAGIC = b"ATTEMPTS1\n"
+
+# how nbautoeval writes dates in .correction files: time.strftime("%D-%H:%M")
+NBAUTOEVAL_FORMATS = ("%m/%d/%y-%H:%M", "%m/%d/%y-%H:%M:%S")
+
+
+# dates only have a one-minute resolution, so they repeat a lot
+@lru_cache(maxsize=2**16)
+def parse_time(date):
+    """
+    the date field as a number of seconds since the epoch, or NO_TIME
+    naive dates are deemed to be in UTC
+
+    the nbautoeval format is tried first, then iso, then a plain number
+    """
+    for date_format in NBAUTOEVAL_FORMATS:
+        try:
+            when = datetime.strptime(date, date_format)
+            break
+        except ValueError:
+            pass
+    else:
+        try:
+            when = datetime.fromisoformat(date)
+        except ValueError:
+            try:
+                return int(float(date))
+            except ValueError:
+                return NO_TIME
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return int(when.timestamp())
+
+
+class AttemptStore:
+    # column name -> array typecode
+    COLUMNS = dict(time='q', student='I', id1='I', id2='I', function='I', ok='b')
+
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        for column, typecode in self.COLUMNS.items():
+            setattr(self, column, array(typecode))
+
+    def __len__(self):
+        return len(self.ok)
+
+    def intern(self, name):
+        try:
+            return self.index[name]
+        except KeyError:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+            return self.index[name]
+
+    def append(self, student, date, id1, id2, function, result):
+        self.time.append(parse_time(date))
+        self.student.append(self.intern(student))
+        self.id1.append(self.intern(id1))
+        self.id2.append(self.intern(id2))
+        self.function.append(self.intern(function))
+        self.ok.append(result == "OK")
+
+    def extend(self, other):
+        """
+        append all the rows of another store, typically built in another process
+        """
+        remap = [self.intern(name) for name in other.names]
+        self.time.extend(other.time)
+        self.ok.extend(other.ok)
+        for column in ('student', 'id1', 'id2', 'function'):
+            getattr(self, column).extend(
+                remap[value] for value in getattr(other, column))
+        return self
+
+    # persistence: the magic line, a json header line, then the raw columns
+    def save(self, filename):
+        header = dict(byteorder=sys.byteorder, rows=len(self), names=self.names)
+        with open(filename, 'wb') as output:
+            output.write(MAGIC)
+            output.write(json.dumps(header).encode() + b"\n")
+            for column in self.COLUMNS:
+                getattr(self, column).tofile(output)
+
+    @staticmethod
+    def load(filename):
+        store = AttemptStore()
+        with open(filename, 'rb') as feed:
+            if feed.readline() != MAGIC:
+                raise ValueError("{} is not an attempts store".format(filename))
+            header = json.loads(feed.readline())
+            store.names = header['names']
+            store.index = {name: i for i, name in enumerate(store.names)}
+            for column in store.COLUMNS:
+                values = getattr(store, column)
+                values.fromfile(feed, header['rows'])
+                if header['byteorder'] != sys.byteorder:
+                    values.byteswap()
+        return store
+
+    # queries
+    def attempts_per_day(self):
+        """
+        a sorted list of tuples (day as YYYY-MM-DD, attempts, successful attempts)
+        """
+        attempts = {}
+        successes = {}
+        for when, ok in zip(self.time, self.ok):
+            if when == NO_TIME:
+                continue
+            day = when // DAY
+            attempts[day] = attempts.get(day, 0) + 1
+            successes[day] = successes.get(day, 0) + ok
+        return [(datetime.fromtimestamp(day * DAY, timezone.utc).strftime("%Y-%m-%d"),
+                 attempts[day], successes[day])
+                for day in sorted(attempts)]
+
+    def _first_successes(self):
+        """
+        for each (student, function) that has succeeded at some point:
+        (time of first attempt, time of first success, failures before that)
+        rows are expected in chronological order for a given student,
+        which is how they come in the .correction files
+        """
+        first_attempt = {}
+        failures = {}
+        result = {}
+        for when, student, function, ok in zip(
+                self.time, self.student, self.function, self.ok):
+            key = (student, function)
+            if key in result:
+                continue
+            first_attempt.setdefault(key, when)
+            if ok:
+                result[key] = (first_attempt[key], when, failures.get(key, 0))
+            else:
+                failures[key] = failures.get(key, 0) + 1
+        return result
+
+    def first_success_latency(self):
+        """
+        a dict (student, function) -> seconds from first attempt to first success
+        """
+        return {(self.names[student], self.names[function]): success - first
+                for (student, function), (first, success, _)
+                in self._first_successes().items()
+                if NO_TIME not in (first, success)}
+
+    def retries_before_success(self):
+        """
+        a dict (student, function) -> number of failed attempts before first success
+        """
+        return {(self.names[student], self.names[function]): failures
+                for (student, function), (_, _, failures)
+                in self._first_successes().items()}
+
+
+def main():
+    parser = ArgumentParser(
+        description="query a store created with scan.py --store")
+    parser.add_argument("-d", "--per-day", action='store_true', default=False,
+                        help="attempts and successes per day")
+    parser.add_argument("-l", "--latency", action='store_true', default=False,
+                        help="per exercise, average time to first success, in seconds")
+    parser.add_argument("-r", "--retries", action='store_true', default=False,
+                        help="per exercise, average number of failures before first success")
+    parser.add_argument("filename")
+    args = parser.parse_args()
+
+    store = AttemptStore.load(args.filename)
+    print("{} attempts, {} names".format(len(store), len(store.names)))
+    if args.per_day:
+        for day, attempts, successes in store.attempts_per_day():
+            print(day, attempts, successes)
+    for flag, query in ((args.latency, store.first_success_latency),
+                        (args.retries, store.retries_before_success)):
+        if not flag:
+            continue
+        by_function = {}
+        for (student, function), value in query().items():
+            by_function.setdefault(function, []).append(value)
+        for function in sorted(by_function):
+            values = by_function[function]
+            print(function, "{:.1f}".format(sum(values) / len(values)),
+                  "over {} students".format(len(values)))
+
+
+if __name__ == '__main__':
+    main()
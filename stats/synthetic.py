@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+generate a fake session directory, with one subdir per student
+and a .correction log in each, like the ones fetched by pull.sh
+
+so that scan.py can be measured without real student data
+"""
+
+import os
+import random
+import hashlib
+from datetime import datetime, timedelta
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+# how nbautoeval writes dates, see store.NBAUTOEVAL_FORMATS
+DATE_FORMAT = "%m/%d/%y-%H:%M"
+
+# what malformed lines may look like
+BAD_LINES = [
+    "\n",
+    "garbage\n",
+    "10/20/14-10:00 truncated line\n",
+    "10/20/14-10:00 id1 id2 function OK with extra fields\n",
+]
+
+
+def student_id(index, seed):
+    return hashlib.md5("{}-{}".format(seed, index).encode()).hexdigest()
+
+
+def student_lines(student, exercises, attempts, bad_rate, start, rng):
+    """
+    the lines of one .correction file, in chronological order
+    each exercise gets retried until success - or until the student gives up
+    """
+    when = start + timedelta(seconds=rng.randrange(30 * 24 * 3600))
+    run_id = "{:08x}".format(rng.getrandbits(32))
+    lines = []
+    while len(lines) < attempts:
+        function = rng.choice(exercises)
+        # one chance out of 2 to succeed at first, then better and better
+        for retry in range(rng.randint(1, 6)):
+            when += timedelta(seconds=rng.randrange(10, 600))
+            if rng.random() < bad_rate:
+                lines.append(rng.choice(BAD_LINES))
+                continue
+            ok = rng.random() < 1 - 0.5 / (retry + 1)
+            lines.append("{} {} {} {} {}\n".format(
+                when.strftime(DATE_FORMAT), student, run_id, function, "OK" if ok else "KO"))
+            if ok or len(lines) >= attempts:
+                break
+    return lines
+
+
+def generate(dirname, students=1000, exercises=50, attempts=30,
+             bad_rate=0.001, empty_rate=0.01, seed=0):
+    """
+    create dirname with that many student subdirs; each student makes
+    on average that many attempts; a fraction bad_rate of the lines are
+    malformed, and a fraction empty_rate of the subdirs have no .correction
+
+    returns the total number of lines written
+    """
+    rng = random.Random(seed)
+    function_names = ["exo_{:03d}".format(i) for i in range(exercises)]
+    start = datetime(2014, 10, 1)
+    total = 0
+    for index in range(students):
+        student = student_id(index, seed)
+        subdir = os.path.join(dirname, student)
+        os.makedirs(subdir, exist_ok=True)
+        if rng.random() < empty_rate:
+            continue
+        lines = student_lines(student, function_names,
+                              rng.randint(1, 2 * attempts - 1), bad_rate, start, rng)
+        with open(os.path.join(subdir, ".correction"), 'w') as log:
+            log.writelines(lines)
+        total += len(lines)
+    return total
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-s", "--students", type=int, default=1000)
+    parser.add_argument("-e", "--exercises", type=int, default=50)
+    parser.add_argument("-a", "--attempts", type=int, default=30,
+                        help="average number of attempts per student")
+    parser.add_argument("-b", "--bad-rate", type=float, default=0.001,
+                        help="fraction of malformed lines")
+    parser.add_argument("-E", "--empty-rate", type=float, default=0.01,
+                        help="fraction of student subdirs without a .correction")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("dirname")
+    args = parser.parse_args()
+
+    total = generate(args.dirname, args.students, args.exercises, args.attempts,
+                     args.bad_rate, args.empty_rate, args.seed)
+    print("{} lines written for {} students in {}".format(
+        total, args.students, args.dirname))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""
+run with pytest from the stats/ directory
+"""
+
+from scan import scan, scan_incremental
+
+
+# two attempts glued by a separator that str.splitlines() breaks on, but
+# not a file in text mode; the full scan sees a single malformed line
+GLUES = ["\x0b", "\x1c", "\x85", "\u2028"]
+
+
+def append(path, text):
+    with open(path, 'a', newline='') as log:
+        log.write(text)
+
+
+def test_incremental_like_full_scan(tmp_path):
+    session = tmp_path / "session"
+    student = session / "student"
+    student.mkdir(parents=True)
+    log = student / ".correction"
+    state = str(tmp_path / "state.json")
+    lines = ["10/20/14-10:0{} student run exo{} OK{}10/20/14-10:0{} student run exo{} KO\n"
+             .format(i, i, glue, i, i) for i, glue in enumerate(GLUES)]
+    # a lone \r ends a line in text mode
+    lines.append("10/20/14-10:05 student run exo5 OK\r10/20/14-10:05 student run exo5 KO\n")
+    append(log, "".join(lines[:3]) + lines[3][:10])
+    scan_incremental(str(session), state)
+    append(log, lines[3][10:] + lines[4])
+    incremental = scan_incremental(str(session), state)
+    assert incremental.as_dict() == scan(str(session)).as_dict()
@@ -0,0 +1,26 @@
+"""
+run with pytest from the stats/ directory
+"""
+
+from store import AttemptStore, NO_TIME, parse_time
+from synthetic import generate
+from scan import scan
+
+
+def test_parse_time_nbautoeval():
+    # what nbautoeval writes with time.strftime("%D-%H:%M")
+    assert parse_time("10/20/14-10:00") == parse_time("2014-10-20T10:00:00")
+    assert parse_time("10/20/14-10:00:30") == parse_time("10/20/14-10:00") + 30
+    assert parse_time("garbage") == NO_TIME
+
+
+def test_store_from_synthetic_session(tmp_path):
+    session = tmp_path / "session"
+    generate(str(session), students=50, bad_rate=0, seed=1)
+    store_filename = str(tmp_path / "attempts.store")
+    scan(str(session), store_filename=store_filename)
+    store = AttemptStore.load(store_filename)
+    assert len(store) > 0
+    assert NO_TIME not in store.time
+    assert sum(attempts for _, attempts, _ in store.attempts_per_day()) == len(store)
+    assert store.first_success_latency()
@@ -1,4 +1,5 @@
 import sys
+from pathlib import Path
 
 
 def xpath(top, path):
@@ -80,3 +81,21 @@ def replace_file_with_string(target, new_contents):
     with open(target, 'w') as writer:
         writer.write(new_contents)
     return True
+
+
+def write_if_changed(path, contents):
+    """
+    like replace_file_with_string, but with an exact comparison;
+    this way, unchanged outputs keep their mtime and do not
+    trigger downstream rebuilds
+
+    returns True if the file was (over)written
+    """
+    path = Path(path)
+    try:
+        if path.read_text() == contents:
+            return False
+    except FileNotFoundError:
+        pass
+    path.write_text(contents)
+    return True